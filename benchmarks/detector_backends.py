@@ -0,0 +1,90 @@
+"""
+Benchmark of the face detector backends (ultralytics vs onnxruntime).
+
+Both backends run on the same frames, read from a video or an image, at each
+batch size. The script prints the time per frame and how well the detections
+of the onnxruntime backend match the ultralytics ones.
+
+Usage: python -m benchmarks.detector_backends video.mp4 --frames 200 --batch-sizes 1 8
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from scripts.detectors import OnnxFaceDetector, UltralyticsDetector
+
+
+def read_frames(path, count):
+    """Read up to `count` frames from a video (or a single image, repeated)."""
+    image = cv2.imread(path)
+    if image is not None:
+        return [image] * count
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def time_backend(detector, frames, batch_size, warmup=2):
+    """Return (ms per frame per batch, detections) for `detector` over `frames`."""
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+    for batch in batches[:warmup]:
+        detector(batch)
+    timings, detections = [], []
+    for batch in batches:
+        start = time.perf_counter()
+        detections.extend(detector(batch))
+        timings.append((time.perf_counter() - start) * 1000 / len(batch))
+    return np.array(timings), detections
+
+
+def agreement(reference, candidate, threshold=0.5):
+    """Share of `reference` boxes that have a `candidate` box with IoU above `threshold`."""
+    matched = total = 0
+    for ref, cand in zip(reference, candidate):
+        total += len(ref)
+        if not len(ref) or not len(cand):
+            continue
+        ix1 = np.maximum(ref[:, None, 0], cand[None, :, 0])
+        iy1 = np.maximum(ref[:, None, 1], cand[None, :, 1])
+        ix2 = np.minimum(ref[:, None, 2], cand[None, :, 2])
+        iy2 = np.minimum(ref[:, None, 3], cand[None, :, 3])
+        inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+        area_ref = (ref[:, 2] - ref[:, 0]) * (ref[:, 3] - ref[:, 1])
+        area_cand = (cand[:, 2] - cand[:, 0]) * (cand[:, 3] - cand[:, 1])
+        iou = inter / np.maximum(area_ref[:, None] + area_cand[None, :] - inter, 1e-6)
+        matched += int((iou.max(axis=1) > threshold).sum())
+    return matched / total if total else 1.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the ultralytics and onnxruntime face detectors.")
+    parser.add_argument("path", help="Path to a video or an image.")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames to run.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8], help="Batch sizes to time.")
+    args = parser.parse_args()
+
+    frames = read_frames(args.path, args.frames)
+    if not frames:
+        raise SystemExit(f"Impossible de lire {args.path}")
+    backends = {"ultralytics": UltralyticsDetector(), "onnxruntime": OnnxFaceDetector()}
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+    for batch_size in args.batch_sizes:
+        results = {}
+        for name, detector in backends.items():
+            timings, detections = time_backend(detector, frames, batch_size)
+            results[name] = detections
+            print(f"batch {batch_size:3d}  {name:12s}  p50 {np.percentile(timings, 50):7.2f} ms/frame  "
+                  f"p95 {np.percentile(timings, 95):7.2f} ms/frame  "
+                  f"{sum(map(len, detections)) / len(frames):.2f} faces/frame")
+        print(f"batch {batch_size:3d}  onnxruntime finds {agreement(results['ultralytics'], results['onnxruntime']):.1%} "
+              f"of the ultralytics faces, ultralytics finds "
+              f"{agreement(results['onnxruntime'], results['ultralytics']):.1%} of the onnxruntime ones")
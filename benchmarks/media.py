@@ -0,0 +1,88 @@
+"""
+Synthetic test media for the benchmarks: images and videos with drawn faces,
+tone and noise audio, and subtitles. Everything is generated locally from a
+fixed seed, so runs are reproducible and need no network or real footage.
+"""
+
+import cv2
+import numpy as np
+from scipy.io import wavfile
+
+RESOLUTIONS = {"480p": (854, 480), "1080p": (1920, 1080), "4k": (3840, 2160)}
+FACE_COUNTS = {"0faces": 0, "1face": 1, "many": 8}
+
+
+def face_layout(width, height, count, seed=0):
+    """Random but reproducible face boxes (x, y, w, h), sized relatively to the frame."""
+    rng = np.random.default_rng(seed)
+    size = max(16, height // 6)
+    boxes = []
+    for _ in range(count):
+        w, h = int(size * rng.uniform(0.7, 1.2)), int(size * rng.uniform(0.9, 1.4))
+        boxes.append((int(rng.integers(0, width - w)), int(rng.integers(0, height - h)), w, h))
+    return np.array(boxes, dtype=np.int32).reshape(-1, 4)
+
+
+def draw_face(frame, x, y, w, h):
+    """Draw a simple cartoon face (skin ellipse, eyes, mouth) in the box."""
+    center = (x + w // 2, y + h // 2)
+    cv2.ellipse(frame, center, (w // 2, h // 2), 0, 0, 360, (140, 170, 225), -1)
+    eye = max(2, w // 10)
+    cv2.circle(frame, (x + w // 3, y + h * 2 // 5), eye, (40, 30, 30), -1)
+    cv2.circle(frame, (x + w * 2 // 3, y + h * 2 // 5), eye, (40, 30, 30), -1)
+    cv2.ellipse(frame, (center[0], y + h * 7 // 10), (w // 5, h // 12), 0, 0, 180, (60, 60, 150), max(1, w // 30))
+
+
+def synthetic_frame(width, height, faces, index=0):
+    """Textured background with faces drifting slowly with `index`."""
+    gx = np.linspace(0, 255, width, dtype=np.float32)
+    gy = np.linspace(0, 255, height, dtype=np.float32)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[..., 0] = (gx[None, :] * 0.5 + index) % 256
+    frame[..., 1] = gy[:, None] * 0.6
+    frame[..., 2] = 90
+    for x, y, w, h in faces:
+        dx = int(10 * np.sin(index / 15))
+        draw_face(frame, int(np.clip(x + dx, 0, width - w)), y, w, h)
+    return frame
+
+
+def make_audio(path, seconds, rate=44100, kind="tone"):
+    """Write a mono 16-bit WAV: a voice-like harmonic tone, or white noise."""
+    t = np.arange(int(seconds * rate)) / rate
+    if kind == "tone":
+        signal = sum(np.sin(2 * np.pi * 180 * k * t) / k for k in range(1, 6))
+        signal *= 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)  # Syllable-like envelope
+    else:
+        signal = np.random.default_rng(0).normal(0, 0.3, len(t))
+    signal = signal / np.max(np.abs(signal)) * 0.8 * 32767
+    wavfile.write(path, rate, signal.astype(np.int16))
+    return path
+
+
+def make_image(path, resolution, face_count):
+    """Write a synthetic image (format given by the extension of `path`)."""
+    width, height = RESOLUTIONS[resolution]
+    cv2.imwrite(path, synthetic_frame(width, height, face_layout(width, height, face_count)))
+    return path
+
+
+def make_video(path, resolution, face_count, seconds=2, fps=30, audio_path=None):
+    """Encode a synthetic video (H.264, with `audio_path` as audio track if given)."""
+    from scripts.video import FFmpegWriter
+
+    width, height = RESOLUTIONS[resolution]
+    faces = face_layout(width, height, face_count)
+    writer = FFmpegWriter(path, width, height, fps, audio_source=audio_path)
+    for index in range(int(seconds * fps)):
+        writer.write(synthetic_frame(width, height, faces, index))
+    writer.release()
+    return path
+
+
+def make_srt(path, seconds):
+    """One subtitle line per second (at least one, ffmpeg rejects empty files)."""
+    from scripts.subtitles import write_srt
+    lines = range(max(1, int(np.ceil(seconds))))
+    write_srt([{"start": i, "end": i + 0.9, "text": f"Ligne de test {i}"} for i in lines], path)
+    return path
@@ -0,0 +1,318 @@
+"""
+Offline benchmark suite of the blur pipeline.
+
+Every stage is timed on its own, on synthetic media (see benchmarks/media.py):
+
+- detect:      YOLO face detection, in batches of config.batch_size
+- pixelate:    anonymization of the faces by pixelation
+- blur:        anonymization of the faces by Gaussian blur
+- encode:      H.264 encoding of raw frames through ffmpeg
+- remux:       copy of the video stream with a new audio track
+- fft:         FFT voice anonymization of a tone or a noise WAV
+- subtitles:   subtitle burn-in (re-encode)
+- image:       a whole image file: decode, detection, pixelation and JPEG encode
+
+Each stage and case runs in a fresh process, so the reported peak RSS is the
+one of that stage only (ffmpeg children included). Results are printed and
+written as JSON; `--compare` checks them against a previous JSON and exits
+with status 1 when a stage got slower than `--threshold`.
+
+Usage:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --resolutions 480p --frames 30 --compare bench.json --threshold 0.15
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.media import (FACE_COUNTS, RESOLUTIONS, face_layout, make_audio, make_image, make_srt, make_video,
+                              synthetic_frame)
+
+STAGES = ("detect", "pixelate", "blur", "encode", "remux", "fft", "subtitles", "image")
+AUDIO_KINDS = ("tone", "noise")
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its finished children (ffmpeg), in MB."""
+    scale = 1 if sys.platform == "darwin" else 1024  # Bytes on macOS, kilobytes elsewhere
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * scale / 1024 ** 2
+
+
+def frames_for(resolution, faces, count):
+    width, height = RESOLUTIONS[resolution]
+    boxes = face_layout(width, height, FACE_COUNTS[faces])
+    return [synthetic_frame(width, height, boxes, i) for i in range(count)], boxes
+
+
+def time_runs(function, repeat):
+    """Wall time in seconds of each of `repeat` calls to `function` (after one warm-up call)."""
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_detect(resolution, faces, frame_count, workdir, repeat):
+    from config import batch_size
+    from scripts.detect import detect_faces_batch
+
+    frames, _ = frames_for(resolution, faces, frame_count)
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+    detect_faces_batch(batches[0])  # Model loading and warm-up
+    latencies = []
+    for batch in batches:
+        start = time.perf_counter()
+        detect_faces_batch(batch)
+        latencies.extend([(time.perf_counter() - start) / len(batch)] * len(batch))
+    return latencies, len(frames)
+
+
+def bench_anonymize(mode):
+    def bench(resolution, faces, frame_count, workdir, repeat):
+        from scripts.detect import anonymize_regions
+
+        frames, boxes = frames_for(resolution, faces, frame_count)
+        anonymize_regions(frames[0].copy(), boxes, mode)
+        latencies = []
+        for frame in frames:
+            start = time.perf_counter()
+            anonymize_regions(frame, boxes, mode)
+            latencies.append(time.perf_counter() - start)
+        return latencies, len(frames)
+    return bench
+
+
+def bench_encode(resolution, faces, frame_count, workdir, repeat):
+    from scripts.video import FFmpegWriter
+
+    frames, _ = frames_for(resolution, faces, frame_count)
+    width, height = RESOLUTIONS[resolution]
+    output = os.path.join(workdir, "encode.mp4")
+    writer = FFmpegWriter(output, width, height, 30)
+    latencies = []
+    start = time.perf_counter()
+    for frame in frames:
+        frame_start = time.perf_counter()
+        writer.write(frame)
+        latencies.append(time.perf_counter() - frame_start)
+    writer.release()
+    # Writes only block on a full pipe, spread the final flush over the frames
+    flush = (time.perf_counter() - start - sum(latencies)) / len(frames)
+    return [latency + flush for latency in latencies], len(frames)
+
+
+def _video_with_audio(resolution, faces, frame_count, workdir):
+    seconds = frame_count / 30
+    audio = make_audio(os.path.join(workdir, "tone.wav"), seconds)
+    return make_video(os.path.join(workdir, "input.mp4"), resolution, FACE_COUNTS[faces],
+                      seconds=seconds, audio_path=audio), audio
+
+
+def bench_remux(resolution, faces, frame_count, workdir, repeat):
+    from scripts.outputs import replace_audio
+
+    video, audio = _video_with_audio(resolution, faces, frame_count, workdir)
+    output = os.path.join(workdir, "remux.mp4")
+    timings = time_runs(lambda: replace_audio(video, audio, output), repeat)
+    return [t / frame_count for t in timings], frame_count * len(timings)
+
+
+def bench_subtitles(resolution, faces, frame_count, workdir, repeat):
+    from scripts.outputs import add_subtitles
+
+    video, _ = _video_with_audio(resolution, faces, frame_count, workdir)
+    srt = make_srt(os.path.join(workdir, "input.srt"), frame_count / 30)
+    output = os.path.join(workdir, "subtitled.mp4")
+    timings = time_runs(lambda: add_subtitles(video, srt, output, burn=True), repeat)
+    return [t / frame_count for t in timings], frame_count * len(timings)
+
+
+def bench_image(resolution, faces, frame_count, workdir, repeat):
+    """Items are images: one JPEG read, anonymized and written again by `process_image`."""
+    from scripts.image import process_image
+
+    image = make_image(os.path.join(workdir, "input.jpg"), resolution, FACE_COUNTS[faces])
+    with contextlib.redirect_stdout(io.StringIO()):  # One line printed per image
+        timings = time_runs(lambda: process_image(image, "pixelate", use_index=False), repeat)
+    return timings, len(timings)
+
+
+def bench_fft(kind, seconds, workdir, repeat):
+    """Items are seconds of audio: the reported rate is the speed relative to realtime."""
+    from scripts.fourier import anonymize_wav_stream
+
+    wav = make_audio(os.path.join(workdir, f"{kind}.wav"), seconds, kind=kind)
+    output = os.path.join(workdir, "anonymized.wav")
+    timings = time_runs(lambda: anonymize_wav_stream(wav, output), repeat)
+    return [t / seconds for t in timings], seconds * len(timings)
+
+
+FRAME_STAGES = {
+    "detect": bench_detect,
+    "pixelate": bench_anonymize("pixelate"),
+    "blur": bench_anonymize("blur"),
+    "encode": bench_encode,
+    "remux": bench_remux,
+    "subtitles": bench_subtitles,
+    "image": bench_image,
+}
+
+
+def run_case(stage, case, frame_count, audio_seconds, repeat):
+    """Run one stage on one case (in a worker process) and summarize its timings."""
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        if stage == "fft":
+            latencies, items = bench_fft(case, audio_seconds, workdir, repeat)
+        else:
+            resolution, faces = case.split("/")
+            latencies, items = FRAME_STAGES[stage](resolution, faces, frame_count, workdir, repeat)
+        wall = time.perf_counter() - start
+    latencies = np.array(latencies)
+    return {
+        "stage": stage,
+        "case": case,
+        "items": items,
+        "fps": float(1 / latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "wall_seconds": round(wall, 3),
+    }
+
+
+def cases_for(stage, resolutions, face_counts):
+    if stage == "fft":
+        return list(AUDIO_KINDS)
+    if stage in ("encode", "remux", "subtitles"):
+        face_counts = face_counts[-1:]  # The content barely matters to the encoder
+    return [f"{resolution}/{faces}" for resolution in resolutions for faces in face_counts]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(stages=STAGES, resolutions=tuple(RESOLUTIONS), face_counts=tuple(FACE_COUNTS), frame_count=60,
+              audio_seconds=30, repeat=3):
+    """
+    Run the benchmarks, each stage and case in a fresh process.
+
+    Returns:
+        dict: {"meta": {...}, "results": [one dict per stage and case]}
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for stage in stages:
+        for case in cases_for(stage, list(resolutions), list(face_counts)):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                try:
+                    result = pool.submit(run_case, stage, case, frame_count, audio_seconds, repeat).result()
+                except Exception as e:
+                    result = {"stage": stage, "case": case, "error": f"{type(e).__name__}: {e}"}
+            results.append(result)
+            print_result(result)
+    meta = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "frames": frame_count,
+        "audio_seconds": audio_seconds,
+        "repeat": repeat,
+    }
+    return {"meta": meta, "results": results}
+
+
+def print_result(result):
+    if "error" in result:
+        print(f"{result['stage']:10s} {result['case']:14s} ERREUR {result['error']}")
+        return
+    unit = {"fft": "x realtime", "image": "images/s"}.get(result["stage"], "fps")
+    print(f"{result['stage']:10s} {result['case']:14s} {result['fps']:9.1f} {unit:10s} "
+          f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+          f"peak RSS {result['peak_rss_mb']:7.1f} MB")
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    List the stages that got slower than `threshold` (relative) since `baseline`.
+
+    A case regresses when its rate drops, or its p95 latency grows, by more
+    than `threshold`. Cases missing from either run are ignored.
+
+    Returns:
+        list[str]: One message per regression
+    """
+    reference = {(r["stage"], r["case"]): r for r in baseline["results"] if "error" not in r}
+    regressions = []
+    for result in current["results"]:
+        key = (result["stage"], result["case"])
+        if key not in reference:
+            continue
+        if "error" in result:
+            regressions.append(f"{key[0]} {key[1]}: {result['error']}")
+            continue
+        base = reference[key]
+        if result["fps"] < base["fps"] * (1 - threshold):
+            regressions.append(f"{key[0]} {key[1]}: rate {base['fps']:.1f} -> {result['fps']:.1f} "
+                               f"({result['fps'] / base['fps'] - 1:+.0%})")
+        if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{key[0]} {key[1]}: p95 {base['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms "
+                               f"({result['p95_ms'] / base['p95_ms'] - 1:+.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks of each stage of the blur pipeline.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="Stages to run.")
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=list(RESOLUTIONS),
+                        help="Frame sizes of the synthetic media.")
+    parser.add_argument("--faces", nargs="+", choices=list(FACE_COUNTS), default=list(FACE_COUNTS),
+                        help="Number of synthetic faces per frame.")
+    parser.add_argument("--frames", type=int, default=60, help="Frames per video case.")
+    parser.add_argument("--audio-seconds", type=float, default=30, help="Length of the FFT audio cases.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs of the whole-file stages.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="JSON results of a previous run to check against.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown above which a stage is reported as a regression.")
+    args = parser.parse_args()
+
+    report = run_suite(args.stages, args.resolutions, args.faces, args.frames, args.audio_seconds, args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Résultats sauvegardés : {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"Aucune régression au-delà de {args.threshold:.0%}")
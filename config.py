@@ -1,20 +1,68 @@
 """
 Configuration parameters for face blurring and pixelation using YOLOv8.
-"""
 
-from ultralytics import YOLO
-from ultralytics.utils import LOGGER
-LOGGER.setLevel("ERROR")
+This module is plain data: models are loaded lazily by scripts/models.py.
+"""
 
 # Parameters
 pixel_size = 10  # Size of pixel blocks for pixelation
 blur_size = 199    # Kernel size for Gaussian blur
+fast_blur = True  # Approximate the large Gaussian blur with downscale -> blur -> upscale
 band_size = 2000  # Size of frequency bands for FFT processing
 shift_amount = 1050  # Frequency shift amount for FFT processing
-model = YOLO("utils/yolov8n-face-lindevs.onnx", task="detect", verbose=False)  # Load YOLO model for face detection
+fft_streaming = True  # Anonymize the audio by overlapping windows (constant memory) instead of one FFT
+stream_window = 4096  # Window size (samples) of the streaming FFT
+stream_shift_hz = 20  # Frequency shift of the streaming FFT (about shift_amount on a 1 min clip at 44.1 kHz)
+stream_band_hz = 40  # Width of the bands averaged two by two by the streaming FFT
+face_model_path = "utils/yolov8n-face-lindevs.onnx"  # YOLO model for face detection
+detector_backend = "ultralytics"  # "ultralytics" or "onnxruntime" (direct ONNX Runtime session)
+conf_threshold = 0.25  # Minimum face confidence (onnxruntime backend)
+iou_threshold = 0.7  # NMS IoU threshold (onnxruntime backend)
+ort_intra_op_threads = 0  # ONNX Runtime threads inside an operator (0 = all cores)
+ort_inter_op_threads = 0  # ONNX Runtime threads across operators (0 = default)
+ort_graph_optimization = "all"  # "disable", "basic", "extended" or "all"
 image_exts = (".jpg", ".jpeg", ".png")  # Supported image formats
 video_exts = (".mp4", ".mov", ".m4v")   # Supported video formats
 margin = 0.4  # Margin around detected faces for anonymization
+face_history = 30  # Frames during which a face that disappeared stays anonymized
+close_threshold = 30  # Distance (px) under which a remembered face is considered found again
+batch_size = 8  # Number of video frames sent to YOLO in a single inference call
+detect_stride = 1  # Run YOLO every N frames and track faces in between (1 = every frame)
+scene_cut_threshold = 0.5  # Histogram distance (0-1) that forces a detection on a scene cut
+track_margin = 0.15  # Extra margin around tracked (not detected) faces
+track_max_misses = 1  # Keyframes a tracked face is kept blurred without being re-detected
+detection_index = True  # Save the raw face detections next to the inputs and reuse them on reruns
+queue_size = 32  # Max frames buffered between the decode, detect and encode threads
+workers = 1  # Files of a folder processed in parallel (one process each)
+video_chunks = 1  # Segments (split at keyframes) of one video processed in parallel
+checkpoint_seconds = 300  # Length of the resumable segments of long videos (--incremental)
+realtime_camera = 0  # Webcam index used by realtime_blur.py
+realtime_infer_width = 640  # Width of the frames given to YOLO in realtime mode (0 = full resolution)
+realtime_max_box_age = 0.5  # Frames more than this many seconds newer than the last detection are not shown
+image_batch_size = 16  # Images of the same size sent to YOLO in a single call (folders of images)
+image_decode_threads = 4  # Threads decoding images ahead of detection
+image_write_threads = 4  # Threads encoding the anonymized images
+image_reduced_decode = 1  # Detect on images decoded at 1/2, 1/4 or 1/8 resolution (1 = full resolution)
+jpeg_quality = 95  # Quality of the anonymized JPEG images (0-100)
+png_compression = 3  # Compression level of the anonymized PNG images (0-9, lossless)
+daemon_port = 8765  # Localhost port of the job server (daemon.py)
+daemon_workers = 1  # Jobs run at the same time by the job server
+daemon_queue_size = 100  # Jobs waiting in the job server queue, new jobs are refused beyond
+burn_subtitles = False  # Draw the subtitles into the _subtitled video (re-encode) instead of a subtitle track
+x264_preset = "veryfast"  # x264 speed/compression trade-off for the output videos
+x264_crf = 20  # x264 quality (lower is better, 18-23 is visually transparent)
 
 WHISPER_MODEL = "small"  # "small", "medium", "large" disponibles
-TTS_MODEL_NAME = "tts_models/fr/mai/tacotron2-DDC"
\ No newline at end of file
+WHISPER_LANGUAGE = None  # Langue des sous-titres, None pour la détection automatique
+vad_enabled = True  # Ne transcrire que les passages où quelqu'un parle (voir scripts/vad.py)
+vad_energy_db = 10  # Marge (dB) au-dessus du bruit de fond pour qu'une trame soit de la parole
+vad_flatness = 0.3  # Trames au spectre plus plat que ce seuil ignorées (bruit blanc ≈ 0.56, voix < 0.2)
+vad_padding = 0.2  # Secondes ajoutées avant et après chaque passage de parole
+vad_min_silence = 0.5  # Silences plus courts (s) gardés dans le passage
+vad_min_speech = 0.25  # Passages plus courts (s) ignorés
+vad_max_chunk_seconds = 30  # Durée maximale des morceaux envoyés à Whisper
+transcribe_workers = 2  # Processus Whisper en parallèle sur les morceaux (chacun charge son modèle)
+TTS_LANGUAGE = "fr"  # Langue de la voix TTS (et de la transcription en mode --tts)
+TTS_MODEL_NAME = "tts_models/fr/mai/tacotron2-DDC"
+tts_workers = 2  # Processus de synthèse vocale en parallèle (chacun charge son propre modèle)
+tts_cache_size = 256  # Phrases synthétisées gardées en mémoire pour être réutilisées
@@ -0,0 +1,324 @@
+"""
+Job server keeping the models loaded between jobs.
+
+`python main.py` loads YOLO and Whisper (and imports torch) on every run, which
+dominates the time of small jobs. The server loads them once, then runs the
+jobs sent to it with `main.process`:
+
+- it listens on localhost only (HTTP, JSON bodies);
+- jobs wait in a bounded queue and `--workers` threads run them, each job
+  on a whole video (no `--chunks`: a pool per job would load YOLO again in
+  every segment worker, so parallelism comes from `--workers`);
+- the status of each job (queued, running with its current stage, done,
+  failed) can be read at any time;
+- on shutdown, new jobs are refused and the jobs already accepted are
+  finished before the server exits (queued ones can be cancelled instead).
+
+    python daemon.py serve --workers 2
+    python daemon.py submit name_of_file_or_folder.extension --blur --wait
+    python daemon.py status [JOB_ID]
+    python daemon.py shutdown [--cancel-queued]
+
+Endpoints: POST /jobs, GET /jobs, GET /jobs/<id>, POST /shutdown.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import batch_size, daemon_port, daemon_queue_size, daemon_workers, detect_stride
+from config import transcribe_workers, vad_enabled
+
+HOST = "127.0.0.1"
+# Accepted `main.process` options (`chunks` is always 1, see above)
+JOB_OPTIONS = {"use_blur", "use_tts", "batch_size", "detect_stride", "burn_subtitles"}
+MAX_FINISHED_JOBS = 1000  # Finished jobs kept for `status`, the oldest are forgotten
+
+
+class JobQueue:
+    """Jobs of the server: a bounded queue, the threads running them and their status."""
+
+    def __init__(self, workers=daemon_workers, queue_size=daemon_queue_size):
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.jobs = {}  # Job id -> status dict, in submission order
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.accepting = True
+        self.threads = [threading.Thread(target=self._work, name=f"job-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, path, options):
+        """
+        Queue one job per file of `path` (a file or a folder).
+
+        Returns:
+            list[dict]: Status of the new jobs
+
+        Raises:
+            ValueError: Unknown path or option
+            queue.Full: Not enough room in the queue (no job is queued then)
+            RuntimeError: The server is shutting down
+        """
+        from main import collect_paths
+        unknown = set(options) - JOB_OPTIONS
+        if unknown:
+            raise ValueError(f"Unknown options {sorted(unknown)}, use {sorted(JOB_OPTIONS)}")
+        paths = collect_paths(path)
+        if paths is None:
+            raise ValueError(f"Invalid path {path}")
+        with self.lock:
+            if not self.accepting:
+                raise RuntimeError("The server is shutting down")
+            if self.pending.maxsize - self.pending.qsize() < len(paths):
+                raise queue.Full(f"Queue full ({self.pending.qsize()}/{self.pending.maxsize} jobs waiting)")
+            jobs = []
+            for file_path in paths:
+                job = {"id": str(next(self.ids)), "path": file_path, "options": options, "status": "queued",
+                       "stage": None, "submitted": time.time(), "started": None, "finished": None,
+                       "seconds": None, "error": None}
+                self.jobs[job["id"]] = job
+                self.pending.put_nowait(job["id"])
+                jobs.append(dict(job))
+        return jobs
+
+    def _work(self):
+        from main import process
+        while True:
+            job_id = self.pending.get()
+            if job_id is None:
+                return
+            with self.lock:
+                job = self.jobs[job_id]
+                if job["status"] != "queued":
+                    continue  # Cancelled meanwhile
+                job.update(status="running", started=time.time())
+
+            def progress(stage):
+                with self.lock:
+                    job["stage"] = stage
+
+            try:
+                process(job["path"], progress=progress, chunks=1, **job["options"])
+                status, error = "done", None
+            except Exception:
+                status, error = "failed", traceback.format_exc()
+            with self.lock:
+                job.update(status=status, error=error, finished=time.time(), seconds=time.time() - job["started"])
+                self._forget_old_jobs()
+            print(f"{'❌' if error else '✅'} [{job_id}] {job['path']} ({job['seconds']:.1f}s)")
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job["finished"] is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def status(self, job_id=None):
+        """Status of one job (None if unknown), or of all the jobs and of the queue."""
+        with self.lock:
+            if job_id is not None:
+                job = self.jobs.get(job_id)
+                return dict(job) if job else None
+            jobs = [dict(job) for job in self.jobs.values()]
+            return {
+                "accepting": self.accepting,
+                "queued": sum(job["status"] == "queued" for job in jobs),
+                "running": sum(job["status"] == "running" for job in jobs),
+                "jobs": jobs,
+            }
+
+    def drain(self, cancel_queued=False):
+        """Refuse new jobs, then wait for the accepted ones (or only the running ones) to finish."""
+        with self.lock:
+            self.accepting = False
+            if cancel_queued:
+                for job in self.jobs.values():
+                    if job["status"] == "queued":
+                        job.update(status="cancelled", finished=time.time())
+        for _ in self.threads:
+            self.pending.put(None)  # After the accepted jobs: each thread stops once the queue is empty
+        for thread in self.threads:
+            thread.join()
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """JSON API of the server (`self.server.jobs` is the JobQueue)."""
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/jobs":
+            self._reply(200, self.server.jobs.status())
+        elif self.path.startswith("/jobs/"):
+            job = self.server.jobs.status(self.path[len("/jobs/"):])
+            self._reply(200, job) if job else self._reply(404, {"error": "Unknown job"})
+        else:
+            self._reply(404, {"error": "Unknown endpoint"})
+
+    def do_POST(self):
+        try:
+            body = self._body()
+        except ValueError:
+            return self._reply(400, {"error": "Invalid JSON body"})
+        if self.path.rstrip("/") == "/jobs":
+            try:
+                self._reply(202, {"jobs": self.server.jobs.submit(body.get("path", ""), body.get("options", {}))})
+            except ValueError as e:
+                self._reply(400, {"error": str(e)})
+            except (queue.Full, RuntimeError) as e:
+                self._reply(503, {"error": str(e)})
+        elif self.path.rstrip("/") == "/shutdown":
+            self.server.stop(cancel_queued=bool(body.get("cancel_queued")))
+            self._reply(202, {"status": "shutting down"})
+        else:
+            self._reply(404, {"error": "Unknown endpoint"})
+
+    def log_message(self, format, *args):
+        pass  # One line per job is printed by the workers instead of one per request
+
+
+class JobServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=daemon_port, workers=daemon_workers, queue_size=daemon_queue_size):
+        super().__init__((HOST, port), JobHandler)
+        self.jobs = JobQueue(workers, queue_size)
+        self.stopping = threading.Event()
+
+    def stop(self, cancel_queued=False):
+        """Drain the jobs then stop serving, without blocking the caller (e.g. a request handler)."""
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+
+        def drain_then_stop():
+            self.jobs.drain(cancel_queued)
+            self.shutdown()
+
+        threading.Thread(target=drain_then_stop, name="drain").start()
+
+
+def serve(port=daemon_port, workers=daemon_workers, queue_size=daemon_queue_size, preload_whisper=True):
+    """Load the models, then run jobs until a shutdown request or Ctrl+C / SIGTERM."""
+    from scripts.models import preload
+    print("Chargement des modèles...")
+    # With chunked transcription, Whisper is loaded by the worker processes of scripts/transcription.py
+    preload(whisper=preload_whisper and not (vad_enabled and transcribe_workers > 1))
+    server = JobServer(port, workers, queue_size)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: server.stop())
+    print(f"En attente de tâches sur http://{HOST}:{port} ({workers} en parallèle)")
+    server.serve_forever()
+    server.server_close()
+    print("Serveur arrêté")
+
+
+def request(method, endpoint, body=None, port=daemon_port):
+    """Call the server, returning (HTTP code, JSON body)."""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(f"http://{HOST}:{port}{endpoint}", data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def wait_for(job_ids, port=daemon_port, interval=1.0):
+    """Poll the server until every job of `job_ids` is finished. Returns their final status."""
+    jobs = {}
+    while len(jobs) < len(job_ids):
+        for job_id in job_ids:
+            if job_id not in jobs:
+                code, job = request("GET", f"/jobs/{job_id}", port=port)
+                if code == 404:
+                    raise RuntimeError(f"Job {job_id} is unknown to the server")
+                if job["finished"] is not None:
+                    jobs[job_id] = job
+        time.sleep(interval if len(jobs) < len(job_ids) else 0)
+    return [jobs[job_id] for job_id in job_ids]
+
+
+def print_job(job):
+    stage = f" ({job['stage']})" if job["status"] == "running" and job["stage"] else ""
+    seconds = f" {job['seconds']:.1f}s" if job["seconds"] is not None else ""
+    print(f"[{job['id']}] {job['status']}{stage}{seconds}  {job['path']}")
+    if job["error"]:
+        print(job["error"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Job server keeping the face blurring models loaded.")
+    parser.add_argument("--port", type=int, default=daemon_port, help="Localhost port of the server.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Start the server.")
+    serve_parser.add_argument("--workers", type=int, default=daemon_workers, help="Jobs run at the same time.")
+    serve_parser.add_argument("--queue-size", type=int, default=daemon_queue_size, help="Jobs waiting at most.")
+    serve_parser.add_argument("--no-whisper", action="store_true", help="Do not load Whisper up front (images only).")
+    submit_parser = commands.add_parser("submit", help="Queue an image, a video or a folder.")
+    submit_parser.add_argument("path", help="Path to an image, video, or folder.")
+    submit_parser.add_argument("--blur", action="store_true", help="Use Gaussian blur instead of pixelation.")
+    submit_parser.add_argument("--tts", action="store_true", help="Use TTS for audio anonymization.")
+    submit_parser.add_argument("--batch-size", type=int, default=batch_size, help="Number of video frames per YOLO inference call.")
+    submit_parser.add_argument("--detect-stride", type=int, default=detect_stride, help="Run YOLO every N frames and track faces in between.")
+    submit_parser.add_argument("--burn-subtitles", action="store_true", help="Draw the subtitles into the video instead of adding a subtitle track.")
+    submit_parser.add_argument("--wait", action="store_true", help="Wait for the jobs to finish.")
+    status_parser = commands.add_parser("status", help="Show the status of one job or of all the jobs.")
+    status_parser.add_argument("job_id", nargs="?", help="Job id returned by submit.")
+    shutdown_parser = commands.add_parser("shutdown", help="Stop the server once the accepted jobs are finished.")
+    shutdown_parser.add_argument("--cancel-queued", action="store_true", help="Only finish the running jobs.")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port, args.workers, args.queue_size, preload_whisper=not args.no_whisper)
+        sys.exit(0)
+    try:
+        if args.command == "submit":
+            options = {"use_blur": "blur" if args.blur else "pixelate", "use_tts": args.tts,
+                       "batch_size": args.batch_size, "detect_stride": args.detect_stride,
+                       "burn_subtitles": args.burn_subtitles}
+            # The server may run from another folder
+            code, reply = request("POST", "/jobs", {"path": os.path.abspath(args.path), "options": options},
+                                  port=args.port)
+            jobs = reply.get("jobs", [])
+            if jobs and args.wait:
+                jobs = wait_for([job["id"] for job in jobs], port=args.port)
+                code = 200 if all(job["status"] == "done" for job in jobs) else 500
+        elif args.command == "status":
+            code, reply = request("GET", f"/jobs/{args.job_id}" if args.job_id else "/jobs", port=args.port)
+            jobs = [reply] if args.job_id and code == 200 else reply.get("jobs", [])
+            if not args.job_id and code == 200:
+                print(f"{reply['running']} en cours, {reply['queued']} en attente")
+        else:
+            code, reply = request("POST", "/shutdown", {"cancel_queued": args.cancel_queued}, port=args.port)
+            jobs = []
+            print(reply.get("status", ""))
+    except urllib.error.URLError:
+        print(f"Aucun serveur sur le port {args.port} (lancez `python daemon.py serve`)")
+        sys.exit(1)
+    for job in jobs:
+        print_job(job)
+    if "error" in reply and not jobs:
+        print(f"Erreur : {reply['error']}")
+    sys.exit(0 if code < 400 else 1)
@@ -1,62 +1,181 @@
 import os
 import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from config import image_exts, video_exts
-from scripts.image import process_image
-from scripts.video import process_video, add_audio_to_video
-from scripts.audio import process_audio
-from scripts.subtitles import add_subtitles
-
-def process(path, use_blur='pixelate', use_tts=False):
-    # Generate file paths for different processing stages
-    base, ext = os.path.splitext(path)
-    tmp_video_path = f"{base}_tmp{ext}"  # Temporary video without audio
-    blurred_output_path = f"{base}_blurred{ext}"  # Video with blurred faces and original audio
-    anonymized_output_path = f"{base}_blurred_anonymized{ext}"
-    subtitled_output_path = f"{base}_subtitled.srt"
-    subtitled_output_video_path = f"{base}_subtitled{ext}"
+from config import image_exts, video_exts, batch_size, detect_stride, workers, video_chunks, burn_subtitles
+from scripts import metrics
+from scripts.manifest import Manifest, config_fingerprint, is_generated
+from scripts.outputs import add_subtitles, replace_audio, video_outputs
+from scripts.parallel import run_files, print_summary
 
+def process(path, use_blur='pixelate', use_tts=False, batch_size=batch_size, detect_stride=detect_stride,
+            chunks=video_chunks, manifest_path=None, progress=None, burn_subtitles=burn_subtitles):
+    # Generate file paths for different processing stages (see scripts/outputs.py)
+    outputs = video_outputs(path)
+    blurred_output_path = outputs["blurred"]
+    anonymized_output_path = outputs["anonymized"]
+    subtitled_output_path = outputs["srt"]
+    subtitled_output_video_path = outputs["subtitled"]
+    transcript_path = outputs["transcript"]
+
+    # Incremental mode: skip the stages done by a previous run, record the new ones
+    manifest = Manifest(manifest_path) if manifest_path else None
+    done = manifest.completed(path) if manifest else []
+
+    def started(stage):
+        if progress:
+            progress(stage)  # e.g. the job status of daemon.py
+
+    def completed(stage, *outputs):
+        if manifest:
+            manifest.complete(path, stage, outputs)
+
+    # Processing modules (and their models) are only imported when needed,
+    # so that the CLI starts fast
     # Process image files
     if path.lower().endswith(image_exts):
-        process_image(path, use_blur)
+        from scripts.image import process_image
+        started("image")
+        with metrics.span("process.image"):
+            process_image(path, use_blur)
+        completed("image", blurred_output_path)
+        metrics.count_file_bytes("bytes_read", path)
+        metrics.count_file_bytes("bytes_written", blurred_output_path)
     # Process video files
-    elif path.lower().endswith(video_exts):                        
-        # Step 1: Process video frames
-        process_video(path, tmp_video_path, use_blur=use_blur)
-        # Step 2: Add original audio back
-        add_audio_to_video(path, tmp_video_path, blurred_output_path)
-        # Step 3: Create final version with anonymized audio
+    elif path.lower().endswith(video_exts):
+        from scripts.video import process_video
         if use_tts:
-            from scripts.tts_ai import process_tts
-            process_tts(blurred_output_path, anonymized_output_path, subtitled_output_path, use_blur=use_blur)
+            from scripts.tts_ai import prepare_tts as prepare_audio
         else:
-            process_audio(blurred_output_path, anonymized_output_path, subtitled_output_path)
-        # Clean up temporary file
-        os.remove(tmp_video_path)
-        add_subtitles(anonymized_output_path, subtitled_output_path, subtitled_output_video_path)
+            from scripts.audio import prepare_audio
+
+        cancel = threading.Event()
+
+        def audio_branch():
+            with metrics.span("process.tts" if use_tts else "process.audio"):
+                return prepare_audio(path, audio_dir, subtitled_output_path, transcript_path, cancel=cancel)
+
+        # The audio branch (extraction, voice anonymization, Whisper) only needs the
+        # original file: it runs on its own thread while the frames are processed
+        with tempfile.TemporaryDirectory() as audio_dir, ThreadPoolExecutor(1, thread_name_prefix="audio") as pool:
+            try:
+                anonymized_audio = pool.submit(audio_branch) if "audio" not in done else None
+                # Step 1: Process video frames (encoded together with the original audio)
+                if "video" not in done:
+                    started("video")
+                    with metrics.span("process.video"):
+                        if chunks > 1 or manifest:
+                            # The incremental mode always goes through segments, to resume long videos
+                            from scripts.chunks import process_video_chunked
+                            process_video_chunked(path, blurred_output_path, use_blur=use_blur,
+                                                  batch_size=batch_size, detect_stride=detect_stride, chunks=chunks,
+                                                  checkpoint_key=manifest.checkpoint_key(path) if manifest else None)
+                        else:
+                            process_video(path, blurred_output_path, use_blur=use_blur, batch_size=batch_size,
+                                          detect_stride=detect_stride)
+                    completed("video", blurred_output_path)
+                # Step 2: Create final version with anonymized audio, once both branches are done
+                if anonymized_audio is not None:
+                    started("audio")
+                    audio_path = anonymized_audio.result()
+                    with metrics.span("process.mux"):
+                        # Same video stream as _blurred, only the audio is encoded
+                        replace_audio(blurred_output_path, audio_path, anonymized_output_path)
+                    completed("audio", anonymized_output_path, subtitled_output_path)
+            except BaseException:
+                # Fail fast: the audio branch stops at its next step (its ffmpeg is killed) and
+                # writes nothing more; leaving the with block waits for it, then removes audio_dir
+                cancel.set()
+                raise
+        if "subtitles" not in done:
+            started("subtitles")
+            with metrics.span("process.subtitles"):
+                add_subtitles(anonymized_output_path, subtitled_output_path, subtitled_output_video_path,
+                              burn=burn_subtitles)
+            completed("subtitles", subtitled_output_video_path)
+        # Intermediate files are read back by the later steps
+        metrics.count_file_bytes("bytes_read", path, blurred_output_path, anonymized_output_path)
+        metrics.count_file_bytes("bytes_written", blurred_output_path, anonymized_output_path,
+                                 subtitled_output_path, subtitled_output_video_path)
 
         print(f"✅ Final video generated : ", anonymized_output_path)
 
-def main(path, use_blur='pixelate', use_tts=False):
+def collect_paths(path):
+    """
+    Files to process for `path`: the file itself, or the images and videos of a folder.
+
+    Returns None if `path` does not exist.
+    """
+    if os.path.isfile(path):
+        return [path]
+    if os.path.isdir(path):
+        files = sorted(os.listdir(path))
+        # Only images and videos, other files (and our own outputs) are ignored
+        return [os.path.join(path, f) for f in files
+                if f.lower().endswith(image_exts + video_exts) and not is_generated(f)]
+    return None
+
+def main(path, use_blur='pixelate', use_tts=False, batch_size=batch_size, detect_stride=detect_stride,
+         workers=workers, chunks=video_chunks, metrics_path=None, incremental=False, burn_subtitles=burn_subtitles):
     """
     Main processing function that handles files or directories based on input path.
     
     Args:
         path (str): Path to file or directory to process
         use_blur (bool): If True, uses Gaussian blur; if False, uses pixelation
+        batch_size (int): Number of video frames per YOLO inference call
+        detect_stride (int): Run YOLO every `detect_stride` frames and track faces in between
+        workers (int): Number of files processed in parallel (one process each)
+        chunks (int): Number of segments each video is split into and processed in parallel
+        metrics_path (str): Write the timings and counters of every file to this JSON file
+        incremental (bool): Skip the files already processed with the same settings, resume interrupted ones
+        burn_subtitles (bool): Draw the subtitles into the `_subtitled` video instead of a subtitle track
     """
     
-    paths_to_process = []
-    if os.path.isfile(path):
-        paths_to_process.append(path)
-    elif os.path.isdir(path):
-        files = os.listdir(path)
-        paths_to_process.extend(os.path.join(path, f) for f in files)
-    else:
+    paths_to_process = collect_paths(path)
+    if paths_to_process is None:
         print("Invalid path. Please provide a valid image, video, or folder.")
+        return
+
+    manifest_path = None
+    if incremental:
+        manifest = Manifest(path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path)))
+        manifest_path = manifest.path
+        fingerprint = config_fingerprint(use_blur=use_blur, use_tts=use_tts, detect_stride=detect_stride,
+                                         burn_subtitles=burn_subtitles)
+        total = len(paths_to_process)
+        paths_to_process = [p for p in paths_to_process if not manifest.prepare(p, fingerprint)]
+        print(f"{total - len(paths_to_process)} files already up to date, {len(paths_to_process)} to process")
+
+    if metrics_path:
+        metrics.enable()  # Before the workers are spawned, they inherit it
+
+    results = []
+    bulk_metrics = None
+    images = [p for p in paths_to_process if p.lower().endswith(image_exts)]
+    if len(images) > 1:
+        # Many images: threaded decode/encode and batched detection in this process
+        from scripts.bulk_images import process_images
+        paths_to_process = [p for p in paths_to_process if not p.lower().endswith(image_exts)]
+        results = process_images(images, use_blur=use_blur)
+        bulk_metrics = metrics.snapshot() if metrics_path else None
+        if incremental:
+            from scripts.image import output_path_for
+            for image, _, error, _ in results:
+                if error is None:
+                    manifest.complete(image, "image", [output_path_for(image)])
 
-    for p in paths_to_process:
-        process(p, use_blur=use_blur, use_tts=use_tts)
+    has_videos = any(p.lower().endswith(video_exts) for p in paths_to_process)
+    # Workers transcribe in their own process (no nested pools, see scripts/parallel.py)
+    results += run_files(process, paths_to_process, workers=workers, preload_whisper=has_videos,
+                         use_blur=use_blur, use_tts=use_tts, batch_size=batch_size,
+                         detect_stride=detect_stride, chunks=chunks, manifest_path=manifest_path,
+                         burn_subtitles=burn_subtitles)
+    print_summary(results)
+    if metrics_path:
+        metrics.write_report(metrics_path, results, shared=bulk_metrics)
 
 
 if __name__ == "__main__":
@@ -65,7 +184,16 @@ if __name__ == "__main__":
     parser.add_argument("path", help="Path to an image, video, or folder.")
     parser.add_argument("--blur", action="store_true", help="Use Gaussian blur instead of pixelation.")
     parser.add_argument("--tts", action="store_true", help="Use TTS for audio anonymization.")
+    parser.add_argument("--batch-size", type=int, default=batch_size, help="Number of video frames per YOLO inference call.")
+    parser.add_argument("--detect-stride", type=int, default=detect_stride, help="Run YOLO every N frames and track faces in between.")
+    parser.add_argument("--workers", type=int, default=workers, help="Number of files processed in parallel.")
+    parser.add_argument("--chunks", type=int, default=video_chunks, help="Split each video at keyframes into N segments processed in parallel.")
+    parser.add_argument("--metrics", metavar="OUT_JSON", help="Write per-step timings and counters to a JSON file.")
+    parser.add_argument("--burn-subtitles", action="store_true", help="Draw the subtitles into the video (re-encodes it) instead of adding a subtitle track.")
+    parser.add_argument("--incremental", action="store_true", help="Skip files already processed with the same settings and resume interrupted ones.")
     args = parser.parse_args()
     args.blur = 'blur' if args.blur else 'pixelate'
     args.use_tts = args.tts
-    main(args.path, use_blur=args.blur, use_tts=args.use_tts)
+    main(args.path, use_blur=args.blur, use_tts=args.use_tts, batch_size=args.batch_size,
+         detect_stride=args.detect_stride, workers=args.workers, chunks=args.chunks, metrics_path=args.metrics,
+         incremental=args.incremental, burn_subtitles=args.burn_subtitles or burn_subtitles)
@@ -1,49 +1,262 @@
 """
-Script to apply face anonymization techniques (blurring and pixelation) 
+Script to apply face anonymization techniques (blurring and pixelation)
 in real-time using a webcam feed.
+
+Capture, detection and display run at their own pace:
+- a capture thread only keeps the newest frame, so frames never pile up when
+  detection is slower than the camera;
+- a detection thread runs YOLO on the newest frame at a reduced resolution and
+  maps the boxes back to full resolution;
+- the display loop anonymizes every captured frame with the latest boxes
+  (reused until detection catches up) and shows capture fps, detection fps
+  and latency.
+
+A video file can be given with --source to stand in for the camera.
 """
 
+import argparse
+import threading
+import time
+
 import cv2
 import numpy as np
 
-from config import blur_size, pixel_size, model, margin
-from scripts.detect import detect_and_anonymize_faces
+from config import realtime_camera, realtime_infer_width, realtime_max_box_age
+from scripts.detect import FaceAnonymizer
+
+
+class RateMeter:
+    """Events per second, smoothed with an exponential moving average."""
+
+    def __init__(self, smoothing=0.9):
+        self.smoothing = smoothing
+        self.rate = 0.0
+        self.last = None
+
+    def tick(self, now=None):
+        now = time.perf_counter() if now is None else now
+        if self.last is not None and now > self.last:
+            instant = 1.0 / (now - self.last)
+            self.rate = instant if not self.rate else self.smoothing * self.rate + (1 - self.smoothing) * instant
+        self.last = now
+
+
+class LatestFrameCapture:
+    """Capture thread that only keeps the newest frame."""
+
+    def __init__(self, source):
+        """
+        Args:
+            source (int | str): Camera index, or path to a video file played at its own frame rate
+        """
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise IOError(f"Impossible d'ouvrir la source vidéo {source}")
+        # A file is read as fast as the decoder goes, pace it like a camera
+        self.frame_interval = 1.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 30) if isinstance(source, str) else 0.0
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.meter = RateMeter()
+        self.condition = threading.Condition()
+        self.frame = None
+        self.timestamp = 0.0
+        self.index = -1
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        next_time = time.perf_counter()
+        while self.running:
+            ret, frame = self.cap.read()
+            now = time.perf_counter()
+            with self.condition:
+                if not ret:
+                    self.running = False
+                else:
+                    self.frame, self.timestamp, self.index = frame, now, self.index + 1
+                    self.meter.tick(now)
+                self.condition.notify_all()
+            if self.frame_interval:
+                next_time += self.frame_interval
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+
+    def read(self, last_index=-1, timeout=1.0):
+        """
+        Wait for a frame newer than `last_index`.
+
+        Returns:
+            tuple: (frame, capture timestamp, index), or (None, 0, index) once the source is exhausted
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.index > last_index or not self.running, timeout)
+            if self.index > last_index:
+                return self.frame, self.timestamp, self.index
+            return None, 0.0, self.index
+
+    def release(self):
+        self.running = False
+        self.thread.join()
+        self.cap.release()
 
-# Fonction de pixellisation
-def apply_pixelation(frame, x, y, w, h):
-    face = frame[y:y+h, x:x+w]
-    face = cv2.resize(face, (pixel_size, pixel_size), interpolation=cv2.INTER_LINEAR)
-    face = cv2.resize(face, (w, h), interpolation=cv2.INTER_NEAREST)
-    frame[y:y+h, x:x+w] = face
-    return frame
 
-# Fonction de flou
-def apply_blur(frame, x, y, w, h):
-    face = frame[y:y+h, x:x+w]
-    face = cv2.GaussianBlur(face, (blur_size, blur_size), 30)
-    frame[y:y+h, x:x+w] = face
+class AsyncDetector:
+    """Detection thread running on the newest frame, at reduced resolution."""
+
+    def __init__(self, capture, anonymizer, infer_width=realtime_infer_width):
+        """
+        Args:
+            capture (LatestFrameCapture): Frame source
+            anonymizer (FaceAnonymizer): Session holding the face memory of the stream
+            infer_width (int): Width of the frames given to YOLO (0 for full resolution)
+        """
+        self.capture = capture
+        self.anonymizer = anonymizer
+        self.infer_width = infer_width
+        self.meter = RateMeter()
+        self.lock = threading.Lock()
+        self.faces = np.zeros((0, 4), dtype=np.int32)  # Boxes to anonymize, full resolution
+        self.timestamp = 0.0  # Capture time of the frame the boxes come from
+        self.error = None  # Exception that stopped the detection thread
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="detect", daemon=True)
+        self.thread.start()
+
+    def detect(self, frame):
+        """Detect faces on a downscaled copy of `frame` and return full resolution boxes."""
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.infer_width / width) if self.infer_width else 1.0
+        small = frame if scale == 1.0 else cv2.resize(
+            frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        faces = np.asarray(self.anonymizer.detect([small])[0], dtype=np.float32).reshape(-1, 4)
+        # The margin is relative to the face size, so scaling the boxes back is enough
+        faces = np.round(faces / scale).astype(np.int32)
+        faces[:, 2] = np.minimum(faces[:, 2], width - faces[:, 0])
+        faces[:, 3] = np.minimum(faces[:, 3], height - faces[:, 1])
+        return faces
+
+    def _run(self):
+        index = -1
+        while self.running:
+            frame, timestamp, index = self.capture.read(index)
+            if frame is None:
+                if not self.capture.running:
+                    return
+                continue
+            try:
+                current = self.detect(frame)
+                # Current faces + remembered faces not found again, as in FaceAnonymizer.anonymize
+                faces = np.concatenate([current, self.anonymizer.remembered_faces(current)])
+                self.anonymizer.remember(current)
+            except Exception as e:
+                # Without detection the boxes are outdated: the display loop must stop (see check)
+                self.error = e
+                self.running = False
+                return
+            with self.lock:
+                self.faces, self.timestamp = faces, timestamp
+            self.meter.tick()
+
+    def latest(self):
+        """Last boxes found and the capture time of their frame (0 before the first detection)."""
+        with self.lock:
+            return self.faces, self.timestamp
+
+    def check(self):
+        """Raise the error that stopped the detection thread, if any."""
+        if self.error is not None:
+            raise RuntimeError("La détection des visages s'est arrêtée") from self.error
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+def draw_hud(frame, mode, capture_fps, detect_fps, latency, detection_age):
+    lines = [
+        f"Mode: {mode.upper()}",
+        f"Capture: {capture_fps:.1f} fps  Detection: {detect_fps:.1f} fps",
+        f"Latency: {latency * 1000:.0f} ms  Boxes age: {detection_age * 1000:.0f} ms",
+    ]
+    for i, line in enumerate(lines):
+        cv2.putText(frame, line, (10, 30 + 30 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
     return frame
 
-# Initialisation de la webcam
-cap = cv2.VideoCapture(0)
-mode = 'pixelate'  # Mode par défaut
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
-    frame = detect_and_anonymize_faces(frame, mode)
-
-    # Affichage
-    cv2.putText(frame, f'Mode: {mode.upper()}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-    cv2.imshow('YOLOv8 Face Filter', frame)
-
-    key = cv2.waitKey(1) & 0xFF
-    if key == ord('p'):
-        mode = 'pixelate'
-    elif key == ord('b'):
-        mode = 'blur'
-    elif key == ord('q'):
-        break
-
-cap.release()
-cv2.destroyAllWindows()
+
+def run(source=realtime_camera, mode='pixelate', infer_width=realtime_infer_width, display=True, max_frames=None,
+        max_box_age=realtime_max_box_age):
+    """
+    Run the realtime anonymization loop.
+
+    Args:
+        source (int | str): Camera index or video file
+        mode (str): 'pixelate' or 'blur' (switch with the p/b keys, quit with q)
+        infer_width (int): Width of the frames given to YOLO (0 for full resolution)
+        display (bool): Show the frames in a window, otherwise print the statistics
+        max_frames (int): Stop after this many displayed frames
+        max_box_age (float): Frames captured more than this many seconds after the frame of the last
+                             boxes are not shown (faces may have moved out of the boxes)
+    """
+    capture = LatestFrameCapture(source)
+    anonymizer = FaceAnonymizer(mode)
+    detector = AsyncDetector(capture, anonymizer, infer_width)
+    display_meter = RateMeter()
+    index = -1
+    shown = 0
+    stale = 0  # Frames not shown because the boxes were too old
+    try:
+        while max_frames is None or shown < max_frames:
+            frame, timestamp, index = capture.read(index)
+            if frame is None:
+                if not capture.running:
+                    break
+                continue
+            detector.check()
+
+            # Reuse the last boxes when detection is behind the camera, within max_box_age
+            faces, detection_timestamp = detector.latest()
+            if not detection_timestamp or timestamp - detection_timestamp > max_box_age:
+                stale += 1
+                if display and cv2.waitKey(1) & 0xFF == ord('q'):
+                    break  # Keep the window responsive while no frame is shown
+                continue
+            frame = anonymizer.apply(frame.copy(), faces)  # The capture thread owns the original
+            now = time.perf_counter()
+            display_meter.tick(now)
+            shown += 1
+
+            if display:
+                draw_hud(frame, mode, capture.meter.rate, detector.meter.rate,
+                         now - timestamp, now - detection_timestamp if detection_timestamp else 0.0)
+                cv2.imshow('YOLOv8 Face Filter', frame)
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('p'):
+                    mode = 'pixelate'
+                elif key == ord('b'):
+                    mode = 'blur'
+                elif key == ord('q'):
+                    break
+                anonymizer.use_blur = mode
+            elif shown % 30 == 0:
+                print(f"capture {capture.meter.rate:.1f} fps | detection {detector.meter.rate:.1f} fps | "
+                      f"display {display_meter.rate:.1f} fps | latency {(now - timestamp) * 1000:.0f} ms | "
+                      f"not shown (old boxes) {stale}")
+    finally:
+        capture.running = False
+        detector.stop()
+        capture.release()
+        if display:
+            cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time face blurring/pixelation from a webcam.")
+    parser.add_argument("--source", default=str(realtime_camera), help="Camera index or path to a video file.")
+    parser.add_argument("--blur", action="store_true", help="Start with Gaussian blur instead of pixelation.")
+    parser.add_argument("--infer-width", type=int, default=realtime_infer_width,
+                        help="Width of the frames given to YOLO (0 for full resolution).")
+    parser.add_argument("--no-display", action="store_true", help="Print statistics instead of opening a window.")
+    parser.add_argument("--max-frames", type=int, default=None, help="Stop after this many frames.")
+    args = parser.parse_args()
+    source = int(args.source) if args.source.isdigit() else args.source
+    run(source, mode='blur' if args.blur else 'pixelate', infer_width=args.infer_width,
+        display=not args.no_display, max_frames=args.max_frames)
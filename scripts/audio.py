@@ -1,34 +1,74 @@
 import os
 import tempfile
-from moviepy import VideoFileClip, AudioFileClip
 
-from scripts.fourier import fourier_transform
+from scripts import metrics
+from scripts.cancel import check
+from scripts.fourier import anonymize_audio
+from scripts.outputs import replace_audio
 from scripts.subtitles import generate_subtitles
 
-def process_audio(video_path, output_path, output_srt):
+def extract_audio(video_path, audio_path, cancel=None):
+    """
+    Extract the audio track of a video to a mono 16-bit WAV file with ffmpeg.
+
+    Args:
+        video_path (str): Path to input video file
+        audio_path (str): Path for the extracted WAV file
+        cancel (threading.Event): Kills ffmpeg when set (see scripts/cancel.py)
+    """
+    command = [
+        "ffmpeg",
+        "-y",
+        "-i", video_path,
+        "-vn",  # No video decoding
+        "-ac", "1",
+        "-c:a", "pcm_s16le",
+        audio_path
+    ]
+    with metrics.span("audio.extract"):
+        metrics.run(command, name="ffmpeg_extract_audio", cancel=cancel, check=True, capture_output=True)
+
+def prepare_audio(source_path, audio_dir, output_srt, transcript_path=None, cancel=None):
+    """
+    Audio branch of a video: anonymize the voices and generate the subtitles.
+
+    Only the original file is needed, so this runs while the frames are
+    processed (see main.process).
+
+    Args:
+        source_path (str): Original video file
+        audio_dir (str): Folder for the intermediate audio files
+        output_srt (str): Path for the generated SRT subtitles
+        transcript_path (str): Optional JSON file caching the transcript between runs
+        cancel (threading.Event): Stops the branch between its steps when set (see scripts/cancel.py)
+
+    Returns:
+        str: Path of the anonymized WAV file
+    """
+    audio_path = os.path.join(audio_dir, "original_audio.wav")
+    anonymized_audio_path = os.path.join(audio_dir, "anonymized_audio.wav")
+    extract_audio(source_path, audio_path, cancel)
+
+    # Anonymize audio by pitch shifting
+    check(cancel)
+    anonymize_audio(audio_path, anonymized_audio_path)
+
+    check(cancel)
+    generate_subtitles(audio_path, output_srt, transcript_path, cancel)
+    return anonymized_audio_path
+
+def process_audio(video_path, output_path, output_srt, transcript_path=None):
     """
     Process video audio: anonymize voices and generate subtitles.
-    
+
     Args:
         video_path (str): Path to input video file
         output_path (str): Path for final output video with anonymized audio
+        output_srt (str): Path for the generated SRT subtitles
+        transcript_path (str): Optional JSON file caching the transcript between runs
     """
-    
+
     # Use temporary directory for intermediate audio files
     with tempfile.TemporaryDirectory() as tmpdir:
-        video = VideoFileClip(video_path)
-        audio_path = os.path.join(tmpdir, "original_audio.wav")
-        # Create anonymized audio file path
-        anonymized_audio_path = os.path.join(tmpdir, "anonymized_audio.wav")
-        
-        # Anonymize audio by pitch shifting
-        fourier_transform(video, audio_path, anonymized_audio_path)
-        
-        generate_subtitles(audio_path, output_srt)
-        
-        # Load anonymized audio and create final video
-        new_audio = AudioFileClip(anonymized_audio_path)
-        final_video = video.with_audio(new_audio)
-        
-        # Write final video with anonymized audio
-        final_video.write_videofile(output_path, codec="libx264", audio_codec="aac")
\ No newline at end of file
+        anonymized_audio_path = prepare_audio(video_path, tmpdir, output_srt, transcript_path)
+        replace_audio(video_path, anonymized_audio_path, output_path)
@@ -0,0 +1,202 @@
+"""
+Bulk anonymization of many images.
+
+Instead of reading, detecting and writing one photo after the other:
+- a pool of threads decodes the next images ahead of time;
+- decoded images wait in groups of the same size, and each full group goes
+  through YOLO in a single call;
+- a second pool anonymizes and encodes the results (JPEG quality and PNG
+  compression from the config).
+
+With `reduced` > 1, YOLO runs on the image decoded at 1/2, 1/4 or 1/8 of its
+resolution (`cv2.IMREAD_REDUCED_COLOR_*`, much faster for large JPEGs) and the
+boxes are scaled back to the full image, which is still the one anonymized.
+
+An error on one file (unreadable, detection or write failure) is reported for
+that file only, the others go on.
+"""
+
+import hashlib
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from config import (detection_index, image_batch_size, image_decode_threads, image_reduced_decode,
+                    image_write_threads)
+from scripts import metrics
+from scripts.detect import anonymize_regions, detect_raw_batch, expand_boxes
+from scripts.detection_index import DetectionIndex, index_key
+from scripts.image import output_path_for, write_params
+
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class _Item:
+    """One image going through the engine."""
+
+    __slots__ = ("path", "start", "image", "small", "index", "raw", "fresh", "error")
+
+    def __init__(self, path, start):
+        self.path = path
+        self.start = start
+        self.image = self.small = self.index = self.raw = self.error = None
+        self.fresh = False  # Detections computed by this run (to be saved in the index)
+
+
+def _decode(path, start, reduced, use_index):
+    """Read and decode one image (decode thread)."""
+    item = _Item(path, start)
+    try:
+        data = np.fromfile(path, dtype=np.uint8)
+        item.image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if item.image is None:
+            raise ValueError(f"Impossible de lire l'image {path}")
+        item.small = item.image if reduced == 1 else cv2.imdecode(data, REDUCED_FLAGS[reduced])
+        if use_index:
+            key = index_key(path, sha256=hashlib.sha256(data).hexdigest())
+            if reduced != 1:
+                key["reduced_decode"] = reduced  # Detections on reduced images differ slightly
+            item.index = DetectionIndex(path, key=key)
+            item.raw = item.index.get(0)
+    except Exception:
+        item.error = traceback.format_exc()
+    return item
+
+
+def _detect(items):
+    """Run YOLO on a group of images of the same size, or one by one if the group fails."""
+    try:
+        with metrics.span("detect.inference"):
+            found = detect_raw_batch([item.small for item in items])
+    except Exception:
+        if len(items) == 1:
+            items[0].error = traceback.format_exc()
+            return
+        for item in items:
+            _detect([item])  # Find the image that fails, the others are still anonymized
+        return
+    metrics.count("frames.detected", len(items))
+    for item, raw in zip(items, found):
+        raw = np.asarray(raw, dtype=np.float32).reshape(-1, 5)
+        if item.small is not item.image:
+            # Back to the coordinates of the full image
+            scale_y = item.image.shape[0] / item.small.shape[0]
+            scale_x = item.image.shape[1] / item.small.shape[1]
+            raw[:, :4] *= (scale_x, scale_y, scale_x, scale_y)
+        item.raw, item.fresh = raw, True
+
+
+def _finish(item, use_blur):
+    """Anonymize and encode one image (write thread). Returns (path, seconds, error, None)."""
+    if item.error is None:
+        try:
+            height, width = item.image.shape[:2]
+            faces = expand_boxes(item.raw, width, height)
+            metrics.observe("faces_per_frame", len(faces))
+            with metrics.span("frame.anonymize"):
+                anonymize_regions(item.image, faces, use_blur)
+            output_path = output_path_for(item.path)
+            if not cv2.imwrite(output_path, item.image, write_params(output_path)):
+                raise IOError(f"Impossible d'écrire l'image {output_path}")
+            if item.fresh and item.index is not None:
+                item.index.add(0, item.raw)
+                item.index.save()
+        except Exception:
+            item.error = traceback.format_exc()
+    return item.path, time.perf_counter() - item.start, item.error, None
+
+
+def process_images(paths, use_blur='pixelate', batch_size=image_batch_size, decode_threads=image_decode_threads,
+                   write_threads=image_write_threads, reduced=image_reduced_decode, use_index=detection_index):
+    """
+    Blur or pixelate the faces of many images, writing `{name}_blurred{ext}` next to each.
+
+    Args:
+        paths (list[str]): Images to process
+        use_blur (str): 'blur' or 'pixelate'
+        batch_size (int): Images of the same size sent to YOLO in a single call
+        decode_threads (int): Threads decoding images ahead of detection
+        write_threads (int): Threads anonymizing and encoding the results
+        reduced (int): Detect on images decoded at 1/`reduced` resolution (1, 2, 4 or 8)
+        use_index (bool): Reuse and update the detection index of each image
+
+    Returns:
+        list[tuple]: (path, seconds, error, None) per image, as `run_files`; error is None on success
+    """
+    if reduced not in REDUCED_FLAGS:
+        raise ValueError(f"Unsupported reduced decode {reduced}, use one of {sorted(REDUCED_FLAGS)}")
+    start = time.perf_counter()
+    # Bounds the images held in memory: decoded ahead, waiting for YOLO, and waiting to be written
+    in_flight = max(2 * batch_size, decode_threads + write_threads)
+    remaining = iter(paths)
+    results = []
+    groups = {}  # Shape of the detection image -> images waiting for YOLO
+    decoding, writing = set(), set()
+
+    def collect(futures, block):
+        if block and futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        else:
+            done = {future for future in futures if future.done()}
+        futures -= done
+        return [future.result() for future in done]
+
+    with ThreadPoolExecutor(decode_threads, thread_name_prefix="decode") as decoders, \
+            ThreadPoolExecutor(write_threads, thread_name_prefix="write") as writers:
+
+        def write(items):
+            for item in items:
+                writing.add(writers.submit(_finish, item, use_blur))
+
+        def flush(shape):
+            items = groups.pop(shape)
+            _detect(items)
+            write(items)
+
+        exhausted = False
+        while True:
+            waiting = sum(len(items) for items in groups.values())
+            while not exhausted and len(decoding) + waiting + len(writing) < in_flight:
+                path = next(remaining, None)
+                if path is None:
+                    exhausted = True
+                else:
+                    decoding.add(decoders.submit(_decode, path, time.perf_counter(), reduced, use_index))
+            if not decoding:
+                if exhausted:
+                    break
+                # Every slot is taken by images waiting for YOLO or for the writers
+                if groups:
+                    flush(max(groups, key=lambda shape: len(groups[shape])))
+                else:
+                    results.extend(collect(writing, block=True))
+                continue
+            for item in collect(decoding, block=True):
+                if item.error is not None or item.raw is not None:
+                    write([item])  # Unreadable (reported by the writer) or already in the index
+                    continue
+                shape = item.small.shape
+                groups.setdefault(shape, []).append(item)
+                if len(groups[shape]) >= batch_size:
+                    flush(shape)
+            results.extend(collect(writing, block=False))
+
+        for shape in list(groups):
+            flush(shape)
+        while writing:
+            results.extend(collect(writing, block=True))
+
+    seconds = time.perf_counter() - start
+    metrics.count("images", len(results))
+    failures = sum(1 for result in results if result[2])
+    print(f"{len(results) - failures}/{len(results)} images en {seconds:.1f}s "
+          f"({len(results) / seconds if seconds else 0:.1f} images/s)")
+    return results
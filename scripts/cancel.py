@@ -0,0 +1,64 @@
+"""
+Cooperative cancellation of a branch running on another thread.
+
+main.process runs the audio branch beside the frame pipeline. When the video
+fails, it sets a `threading.Event` given to the branch: the branch checks it
+between its steps (`check`), kills the ffmpeg process it is waiting for
+(`run_process`) and stops waiting for its worker pools (`as_completed`), so
+that it ends quickly and writes nothing more.
+"""
+
+import concurrent.futures
+import subprocess
+
+
+class Cancelled(Exception):
+    """The branch was cancelled by its caller."""
+
+
+def check(cancel):
+    """Raise Cancelled if `cancel` (a threading.Event, or None) is set."""
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+
+
+def run_process(command, cancel, check=False, capture_output=False, text=None, poll_seconds=0.1):
+    """
+    `subprocess.run` that kills the process as soon as `cancel` is set.
+
+    Raises:
+        Cancelled: `cancel` was set before the process ended
+        subprocess.CalledProcessError: With `check`, the process failed
+    """
+    pipe = subprocess.PIPE if capture_output else None
+    with subprocess.Popen(command, stdout=pipe, stderr=pipe, text=text) as process:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=poll_seconds)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel.is_set():
+                    process.kill()
+                    process.communicate()
+                    raise Cancelled() from None
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def as_completed(futures, cancel, poll_seconds=0.1):
+    """
+    `concurrent.futures.as_completed` that stops when `cancel` is set.
+
+    The futures not started yet are cancelled, the running ones are left to
+    finish in their worker (their result is dropped).
+    """
+    pending = set(futures)
+    while pending:
+        done, pending = concurrent.futures.wait(pending, timeout=poll_seconds,
+                                                return_when=concurrent.futures.FIRST_COMPLETED)
+        yield from done
+        if pending and cancel is not None and cancel.is_set():
+            for future in pending:
+                future.cancel()
+            raise Cancelled()
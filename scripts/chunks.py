@@ -0,0 +1,232 @@
+"""
+Parallel processing of one long video, split at keyframes.
+
+The video is cut into K segments starting on keyframes. Each segment is
+detected, anonymized and encoded by `process_video` in its own worker process,
+then the parts are joined with the ffmpeg concat demuxer without re-encoding,
+and the original audio is muxed back in the same pass.
+
+Each worker starts a little before its segment (`warmup_frames`) so that the
+temporal face memory is already filled at the seam.
+
+In the incremental mode the finished parts are kept until the video is joined,
+so an interrupted job only redoes the segments it had not finished.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import cv2
+
+from config import batch_size as default_batch_size, detect_stride as default_detect_stride, face_history
+from config import checkpoint_seconds, detection_index
+from scripts import metrics
+from scripts.detection_index import DetectionIndex
+from scripts.parallel import init_worker, nested_workers, thread_limit
+from scripts.video import process_video
+
+
+def probe_keyframes(path):
+    """
+    Return the indices of the keyframes of the first video stream (ffprobe).
+
+    Args:
+        path (str): Path to the video file
+
+    Returns:
+        list[int]: Frame indices (in decoding order) of the keyframes
+    """
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=flags",
+        "-of", "csv=p=0",
+        path
+    ]
+    output = metrics.run(command, capture_output=True, text=True, check=True).stdout
+    return [index for index, flags in enumerate(output.split()) if "K" in flags]
+
+
+def plan_chunks(keyframes, total_frames, count):
+    """
+    Choose up to `count` segments (start, end) whose starts are keyframes.
+
+    Each split is the keyframe closest to an even division of the video, so
+    segments have roughly the same length. The last segment ends at None
+    (end of the video), since the frame count reported by containers is only
+    an estimate.
+    """
+    starts = {0}
+    candidates = [k for k in keyframes if 0 < k < total_frames]
+    for i in range(1, count):
+        if candidates:
+            target = i * total_frames / count
+            starts.add(min(candidates, key=lambda k: abs(k - target)))
+    starts = sorted(starts)
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def concat_parts(part_paths, audio_source, output_path):
+    """
+    Join video parts with the concat demuxer (stream copy) and add the source audio.
+
+    Args:
+        part_paths (list[str]): Encoded video parts, in order
+        audio_source (str): File whose first audio track is muxed in
+        output_path (str): Path of the joined video
+    """
+    list_path = f"{output_path}.parts.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for part_path in part_paths:
+            escaped = os.path.abspath(part_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    command = [
+        "ffmpeg",
+        "-y",  # Overwrite output file if it exists
+        "-loglevel", "error",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", list_path,
+        "-i", audio_source,
+        "-map", "0:v:0",
+        "-map", "1:a:0?",  # Audio is optional, silent videos have none
+        "-c:v", "copy",  # Parts are already encoded, no re-encoding
+        "-c:a", "aac",
+        output_path
+    ]
+    try:
+        metrics.run(command, name="ffmpeg_concat", check=True)
+    finally:
+        os.remove(list_path)
+
+
+def _encode_part(input_path, part_path, **kwargs):
+    """Process one segment into `part_path`, return its new detections."""
+    tmp_path = f"{os.path.splitext(part_path)[0]}.tmp.mp4"
+    detections = process_video(input_path, tmp_path, **kwargs)
+    os.replace(tmp_path, part_path)  # A part that exists is always complete
+    return detections
+
+
+def _process_part(input_path, part_path, **kwargs):
+    """Worker side of `process_video_chunked`: process one segment, return its new detections and metrics."""
+    metrics.reset()
+    detections = _encode_part(input_path, part_path, **kwargs)
+    return detections, metrics.snapshot() if metrics.enabled() else None
+
+
+@contextmanager
+def _parts_dir(output_path, segments, checkpoint_key):
+    """
+    Folder of the encoded parts.
+
+    Without `checkpoint_key` it is temporary. Otherwise it is `{output}.parts`,
+    kept when the job fails so that the finished parts are reused by the next
+    run, as long as the plan (segments and key) is the same.
+    """
+    if checkpoint_key is None:
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmpdir:
+            yield tmpdir
+        return
+    parts_dir = f"{output_path}.parts"
+    plan_path = os.path.join(parts_dir, "plan.json")
+    plan = {"key": checkpoint_key, "segments": [list(segment) for segment in segments]}
+    try:
+        with open(plan_path, encoding="utf-8") as f:
+            resumable = json.load(f) == plan
+    except (OSError, ValueError):
+        resumable = False
+    if not resumable:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        os.makedirs(parts_dir)
+        with open(plan_path, "w", encoding="utf-8") as f:
+            json.dump(plan, f)
+    yield parts_dir
+    shutil.rmtree(parts_dir)  # Only reached once the parts are joined
+
+
+def process_video_chunked(input_path, output_path, use_blur='pixelate', batch_size=default_batch_size,
+                          detect_stride=default_detect_stride, chunks=2, warmup_frames=None,
+                          use_index=detection_index, checkpoint_key=None):
+    """
+    Treat a video to blur or pixelate faces, with one worker process per segment.
+
+    With `checkpoint_key`, the video is also cut every `checkpoint_seconds`
+    (see config) and the finished segments are kept on disk: a job that was
+    interrupted resumes from the segments it had not finished. The key must
+    change when the input or the settings change (see Manifest.checkpoint_key).
+
+    Args:
+        input_path (str): Path to the input video
+        output_path (str): Path of the anonymized video (with the original audio)
+        use_blur (str): 'blur' or 'pixelate'
+        batch_size (int): Number of frames per YOLO inference call
+        detect_stride (int): Run YOLO every `detect_stride` frames and track faces in between
+        chunks (int): Number of segments processed in parallel
+        warmup_frames (int): Frames analyzed before each segment, defaults to the face memory length
+        use_index (bool): Reuse and update the detection index of the video (saved once, by this process)
+        checkpoint_key (str): Keep the finished segments to resume an interrupted job
+    """
+    cap = cv2.VideoCapture(input_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    cap.release()
+    count = chunks
+    if checkpoint_key is not None:
+        count = max(chunks, math.ceil(total_frames / (checkpoint_seconds * fps)))
+    segments = plan_chunks(probe_keyframes(input_path), total_frames, count)
+    if len(segments) < 2:
+        # Too short or a single keyframe: nothing to split
+        process_video(input_path, output_path, use_blur=use_blur, batch_size=batch_size,
+                      detect_stride=detect_stride, use_index=use_index)
+        return
+
+    if warmup_frames is None:
+        # Enough for the face memory, and for the tracker to see a keyframe
+        warmup_frames = max(face_history, detect_stride)
+    workers = nested_workers(max(1, min(chunks, len(segments))))
+    threads = max(1, thread_limit() // workers)
+    context = multiprocessing.get_context("spawn")
+    # Workers read the index, only this process writes it
+    index = DetectionIndex(input_path) if use_index else None
+    options = dict(use_blur=use_blur, batch_size=batch_size, detect_stride=detect_stride,
+                   warmup_frames=warmup_frames, with_audio=False, use_index=use_index,
+                   index_key=index.key if index is not None else None, save_index=False)
+
+    def finished(detections):
+        if index is not None:
+            index.new.update(detections)
+            if checkpoint_key is not None:
+                index.save()  # Keep the detections of the finished segments too
+
+    with _parts_dir(output_path, segments, checkpoint_key) as parts_dir:
+        part_paths = [os.path.join(parts_dir, f"part_{i:03d}.mp4") for i in range(len(segments))]
+        todo = [(part_path, segment) for part_path, segment in zip(part_paths, segments)
+                if not os.path.exists(part_path)]
+        if len(todo) < len(segments):
+            print(f"Reprise : {len(segments) - len(todo)}/{len(segments)} segments déjà traités")
+        if workers <= 1:
+            # One segment after the other in this process (e.g. checkpoints inside a worker of run_files)
+            for part_path, (start, end) in todo:
+                finished(_encode_part(input_path, part_path, start_frame=start, end_frame=end, **options))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=init_worker, initargs=(threads, False)) as pool:
+                futures = [pool.submit(_process_part, input_path, part_path, start_frame=start, end_frame=end,
+                                       **options)
+                           for part_path, (start, end) in todo]
+                for future in as_completed(futures):
+                    detections, snapshot = future.result()  # Re-raise the first worker error
+                    metrics.merge(snapshot)
+                    finished(detections)
+        concat_parts(part_paths, input_path, output_path)
+    if index is not None:
+        index.save()
+    print(f"Vidéo sauvegardée : {output_path} ({len(segments)} segments)")
@@ -1,10 +1,46 @@
 import cv2
-from collections import deque
 import numpy as np
-from config import blur_size, pixel_size, model, margin
+from config import blur_size, pixel_size, fast_blur, margin, face_history, close_threshold
+from scripts import metrics
+from scripts.models import face_model
 
-# Mémoire des visages détectés sur les dernières frames (3 frames max)
-recent_faces = deque(maxlen=30)
+def fast_gaussian_blur(region, ksize=blur_size):
+    """
+    Équivalent rapide de cv2.GaussianBlur(region, (ksize, ksize), 0) pour les grands noyaux.
+
+    L'image est réduite, floutée avec un sigma réduit d'autant, puis réagrandie :
+    le coût ne dépend presque plus de la taille du noyau.
+    """
+    # Sigma utilisé par OpenCV quand on lui passe sigma = 0
+    sigma = 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+    height, width = region.shape[:2]
+    # On garde un sigma d'environ 4 pixels à basse résolution
+    factor = int(min(sigma // 4, height // 4, width // 4))
+    if not fast_blur or factor < 2:
+        return cv2.GaussianBlur(region, (ksize, ksize), 0)
+    small = cv2.resize(region, (max(1, round(width / factor)), max(1, round(height / factor))),
+                       interpolation=cv2.INTER_AREA)
+    small = cv2.GaussianBlur(small, (0, 0), sigma / factor)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+
+def anonymized(face, use_blur='pixelate', grid=None):
+    """
+    Retourne une copie anonymisée d'une région.
+
+    Paramètres :
+    - face : région de l'image
+    - use_blur : méthode d'anonymisation ('blur' ou 'pixelate')
+    - grid : nombre de blocs (largeur, hauteur) pour la pixellisation, (pixel_size, pixel_size) par défaut
+    """
+    if use_blur == 'blur':
+        # Floutage gaussien
+        return fast_gaussian_blur(face, blur_size)
+    elif use_blur == 'pixelate':
+        # Réduction de la résolution puis réagrandissement pour pixeliser
+        h, w = face.shape[:2]
+        temp = cv2.resize(face, grid or (pixel_size, pixel_size), interpolation=cv2.INTER_LINEAR)
+        return cv2.resize(temp, (w, h), interpolation=cv2.INTER_NEAREST)
+    raise ValueError(f"Méthode inconnue : {use_blur} ; utilisez 'blur' ou 'pixelate'.")
 
 def anonymize_face(image, x, y, w, h, use_blur='pixelate'):
     """
@@ -16,75 +52,210 @@ def anonymize_face(image, x, y, w, h, use_blur='pixelate'):
     - w, h : largeur et hauteur de la région
     - use_blur : méthode d'anonymisation ('blur' ou 'pixelate')
     """
-    face = image[y:y+h, x:x+w]
+    image[y:y+h, x:x+w] = anonymized(image[y:y+h, x:x+w], use_blur)
+    return image
 
-    if use_blur == 'blur':
-        # Floutage classique avec une gaussienne
-        face = cv2.GaussianBlur(face, (blur_size, blur_size), 0)
-    elif use_blur == 'pixelate':
-        # Réduction de la résolution puis réagrandissement pour pixeliser
-        temp = cv2.resize(face, (pixel_size, pixel_size), interpolation=cv2.INTER_LINEAR)
-        face = cv2.resize(temp, (w, h), interpolation=cv2.INTER_NEAREST)
-    else:
-        raise ValueError(f"Méthode inconnue : {use_blur} ; utilisez 'blur' ou 'pixelate'.")
+def group_regions(faces):
+    """
+    Déduplique les régions (x, y, w, h) et les regroupe par paquets qui se chevauchent.
 
-    image[y:y+h, x:x+w] = face
-    return image
+    Retourne une liste de tableaux (K, 4), un par groupe.
+    """
+    boxes = np.unique(np.asarray(faces, dtype=np.int32).reshape(-1, 4), axis=0)
+    boxes = boxes[(boxes[:, 2] > 0) & (boxes[:, 3] > 0)]
+    if len(boxes) < 2:
+        return [boxes] if len(boxes) else []
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    overlap = ((x1[:, None] < x2[None, :]) & (x1[None, :] < x2[:, None]) &
+               (y1[:, None] < y2[None, :]) & (y1[None, :] < y2[:, None]))
+    # Composantes connexes : chaque boîte prend le plus petit label de ses voisines
+    labels = np.arange(len(boxes))
+    while True:
+        merged = np.where(overlap, labels[None, :], len(boxes)).min(axis=1)
+        if np.array_equal(merged, labels):
+            break
+        labels = merged
+    return [boxes[labels == label] for label in np.unique(labels)]
+
+def anonymize_regions(image, faces, use_blur='pixelate'):
+    """
+    Anonymise en une seule passe l'union de toutes les régions d'une frame.
 
-def is_close(face1, face2, threshold=30):
+    Les régions qui se chevauchent sont traitées ensemble : le flou ou la
+    pixellisation est calculé une fois sur le rectangle englobant du groupe,
+    puis recopié à travers le masque de l'union des régions. Chaque pixel n'est
+    donc traité qu'une seule fois, quel que soit le nombre de boîtes.
+
+    Paramètres :
+    - image : image d'entrée (modifiée en place)
+    - faces : régions (x, y, w, h)
+    - use_blur : méthode d'anonymisation ('blur' ou 'pixelate')
     """
-    Vérifie si deux visages sont spatialement proches.
+    for group in group_regions(faces):
+        x1, y1 = group[:, :2].min(axis=0)
+        x2, y2 = (group[:, :2] + group[:, 2:]).max(axis=0)
+        region = image[y1:y2, x1:x2]
+        if len(group) == 1:
+            region[...] = anonymized(region, use_blur)
+            continue
 
-    Utilisé pour détecter si un visage disparu est en fait réapparu très proche.
+        # Blocs de pixellisation de la taille de ceux du plus grand visage du groupe
+        block_w = group[:, 2].max() / pixel_size
+        block_h = group[:, 3].max() / pixel_size
+        grid = (max(1, round((x2 - x1) / block_w)), max(1, round((y2 - y1) / block_h)))
+
+        mask = np.zeros(region.shape[:2], dtype=bool)
+        for x, y, w, h in group - (x1, y1, 0, 0):
+            mask[y:y+h, x:x+w] = True
+        np.copyto(region, anonymized(region, use_blur, grid), where=mask[..., None])
+    return image
+
+def expand_boxes(boxes, width, height, box_margin=margin):
+    """
+    Convertit des boîtes brutes [x1, y1, x2, y2, ...] en régions (x, y, w, h) avec marge.
 
     Paramètres :
-    - face1, face2 : tuples (x, y, w, h)
-    - threshold : distance maximale pour considérer les visages comme proches
+    - boxes : tableau (N, 4+) de détections en pixels
+    - width, height : dimensions de l'image d'origine
+    - box_margin : marge ajoutée de chaque côté, en fraction de la taille du visage
+
+    Retourne un tableau (N, 4) d'entiers.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32)
+    if not boxes.size:
+        return np.zeros((0, 4), dtype=np.int32)
+    x1, y1, x2, y2 = np.trunc(boxes[:, :4]).T
+    w, h = x2 - x1, y2 - y1
+
+    # Calcul des coordonnées avec marge autour du visage
+    x1_m = np.maximum(0, np.trunc(x1 - w * box_margin))
+    y1_m = np.maximum(0, np.trunc(y1 - h * box_margin))
+    x2_m = np.minimum(width, np.trunc(x2 + w * box_margin))
+    y2_m = np.minimum(height, np.trunc(y2 + h * box_margin))
+    return np.stack([x1_m, y1_m, x2_m - x1_m, y2_m - y1_m], axis=1).astype(np.int32)
+
+def detect_raw_batch(frames):
     """
-    x1, y1, w1, h1 = face1
-    x2, y2, w2, h2 = face2
-    return np.linalg.norm([x1 - x2, y1 - y2]) < threshold
+    Détecte les visages sur un lot d'images avec un seul appel au détecteur.
 
-def detect_and_anonymize_faces(img, use_blur='pixelate'):
+    Retourne, pour chaque image, un tableau (N, 5) [x1, y1, x2, y2, score] sans marge.
     """
-    Détecte les visages avec YOLO et applique l'anonymisation.
-    Maintient le flou sur les visages même s'ils disparaissent temporairement.
+    if not frames:
+        return []
+    with face_model() as model:
+        return model(list(frames))
+
+def detect_faces_batch(frames):
+    """
+    Détecte les visages sur un lot d'images avec un seul appel au détecteur.
 
     Paramètres :
-    - img : image d'entrée
-    - use_blur : méthode d'anonymisation ('blur' ou 'pixelate')
+    - frames : liste d'images (toutes issues du même flux)
+
+    Retourne un tableau (N, 4) de régions (x, y, w, h) avec marge par image, dans le même ordre.
+    """
+    with metrics.span("detect.inference"):
+        raw_boxes = detect_raw_batch(frames)
+    metrics.count("frames.detected", len(frames))
+    with metrics.span("detect.boxes"):
+        return [expand_boxes(raw, frame.shape[1], frame.shape[0]) for raw, frame in zip(raw_boxes, frames)]
+
+class FaceAnonymizer:
+    """
+    Session d'anonymisation d'un flux (vidéo, webcam, image).
+
+    Chaque session possède sa propre mémoire des visages des dernières frames,
+    stockée dans des tableaux NumPy préalloués (tampon circulaire). Plusieurs
+    sessions peuvent donc tourner en parallèle dans des threads sans que
+    l'historique d'un flux ne déborde sur un autre.
     """
-    results = model(img)
-    height, width = img.shape[:2]
-    current_faces = []
 
-    # Étape 1 : Détection des visages actuels
-    for result in results:
-        for box in result.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            w, h = x2 - x1, y2 - y1
+    def __init__(self, use_blur='pixelate', history=face_history, threshold=close_threshold, max_faces=16):
+        """
+        Paramètres :
+        - use_blur : méthode d'anonymisation ('blur' ou 'pixelate')
+        - history : nombre de frames pendant lesquelles un visage disparu reste flouté
+        - threshold : distance (pixels) sous laquelle un ancien visage est considéré comme réapparu
+        - max_faces : capacité initiale par frame (agrandie automatiquement si besoin)
+        """
+        self.use_blur = use_blur
+        self.threshold = threshold
+        self.boxes = np.zeros((history, max_faces, 4), dtype=np.int32)  # (x, y, w, h) par frame
+        self.counts = np.zeros(history, dtype=np.int32)  # Nombre de visages de chaque frame
+        self.cursor = 0  # Prochain emplacement à écrire
+        self.filled = 0  # Nombre de frames en mémoire
+
+    def reset(self):
+        """Oublie tous les visages mémorisés (changement de flux)."""
+        self.counts[:] = 0
+        self.cursor = 0
+        self.filled = 0
+
+    def remember(self, faces):
+        """Ajoute les visages d'une frame dans la mémoire circulaire."""
+        faces = np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+        history, capacity = self.boxes.shape[:2]
+        if not history:
+            return
+        if len(faces) > capacity:
+            grown = np.zeros((history, max(len(faces), 2 * capacity), 4), dtype=np.int32)
+            grown[:, :capacity] = self.boxes
+            self.boxes = grown
+        self.boxes[self.cursor, :len(faces)] = faces
+        self.counts[self.cursor] = len(faces)
+        self.cursor = (self.cursor + 1) % history
+        self.filled = min(self.filled + 1, history)
 
-            # Calcul des coordonnées avec marge autour du visage
-            x1_m = max(0, int(x1 - w * margin))
-            y1_m = max(0, int(y1 - h * margin))
-            x2_m = min(width, int(x2 + w * margin))
-            y2_m = min(height, int(y2 + h * margin))
+    def remembered_faces(self, current_faces):
+        """
+        Retourne les visages mémorisés qui ne sont proches d'aucun visage actuel,
+        de la frame la plus ancienne à la plus récente.
+        """
+        history = self.boxes.shape[0]
+        if not self.filled:
+            return np.zeros((0, 4), dtype=np.int32)
+        # Frames dans l'ordre chronologique
+        order = (self.cursor - self.filled + np.arange(self.filled)) % history
+        slots = np.arange(self.boxes.shape[1])[None, :] < self.counts[order][:, None]
+        old = self.boxes[order][slots]
+        current = np.asarray(current_faces, dtype=np.int32).reshape(-1, 4)
+        if not len(old) or not len(current):
+            return old
+        # Distances entre coins supérieurs gauches, en un seul calcul (anciens x actuels)
+        delta = (old[:, None, :2] - current[None, :, :2]).astype(np.float32)
+        close = np.hypot(delta[..., 0], delta[..., 1]) < self.threshold
+        return old[~close.any(axis=1)]
 
-            new_w, new_h = x2_m - x1_m, y2_m - y1_m
-            current_faces.append((x1_m, y1_m, new_w, new_h))
+    def detect(self, frames):
+        """Détecte les visages sur un lot de frames du flux (voir `detect_faces_batch`)."""
+        return detect_faces_batch(frames)
 
-            # Application du flou sur le visage détecté
-            img = anonymize_face(img, x1_m, y1_m, new_w, new_h, use_blur)
+    def apply(self, img, faces):
+        """Anonymise les régions (x, y, w, h) données, sans toucher à la mémoire."""
+        with metrics.span("frame.anonymize"):
+            return anonymize_regions(img, faces, self.use_blur)
 
-    # Étape 2 : Maintien du flou pour les visages récemment détectés
-    for old_faces in recent_faces:
-        for old_face in old_faces:
-            # Si le visage n'est pas proche d'un visage actuel, on le floute quand même
-            if not any(is_close(old_face, cf) for cf in current_faces):
-                x, y, w, h = old_face
-                img = anonymize_face(img, x, y, w, h, use_blur)
+    def anonymize(self, img, current_faces):
+        """
+        Applique l'anonymisation sur les visages détectés et sur ceux des dernières frames.
+        Les frames doivent être passées dans l'ordre du flux.
 
-    # Étape 3 : Mise à jour de la mémoire des visages
-    recent_faces.append(current_faces)
+        Paramètres :
+        - img : image d'entrée
+        - current_faces : régions (x, y, w, h) détectées sur cette image
+        """
+        current = np.asarray(current_faces, dtype=np.int32).reshape(-1, 4)
+        metrics.observe("faces_per_frame", len(current))
+        # Étapes 1 et 2 : visages détectés + visages récents non retrouvés, en une seule passe
+        img = self.apply(img, np.concatenate([current, self.remembered_faces(current)]))
+        # Étape 3 : Mise à jour de la mémoire des visages
+        self.remember(current_faces)
+        return img
 
-    return img
+    def __call__(self, img):
+        """
+        Détecte les visages avec YOLO et applique l'anonymisation.
+        Maintient le flou sur les visages même s'ils disparaissent temporairement.
+        """
+        return self.anonymize(img, self.detect([img])[0])
@@ -0,0 +1,148 @@
+"""
+Sidecar index of the raw face detections of a video or an image.
+
+The raw YOLO boxes (before the margin) of every analyzed frame are saved next
+to the input, so that a rerun with another anonymization style, pixel size,
+blur size or margin only redoes the anonymization and the encoding. The names
+keep the extension of the input (`clip.mp4` and `clip.mov` have their own index):
+
+- `{file}.faces.npy`: records (frame, x1, y1, x2, y2, score), sorted by frame
+- `{file}.faces.frames.npy`: one byte per frame, 1 if YOLO ran on it
+- `{file}.faces.json`: key of the index (content hash of the input, model,
+  backend and thresholds); the arrays are ignored if it does not match
+
+Both arrays are read with `mmap_mode="r"`, so opening the index of a long
+video costs almost nothing. Frames missing from the index (e.g. new keyframes
+with another `detect_stride`) are detected and added on save.
+"""
+
+import json
+import os
+
+import numpy as np
+
+import config
+from scripts import metrics
+from scripts.detect import detect_raw_batch, expand_boxes
+from scripts.transcription import file_hash
+
+INDEX_VERSION = 1
+RECORD = np.dtype([("frame", "<i4"), ("x1", "<f4"), ("y1", "<f4"), ("x2", "<f4"), ("y2", "<f4"),
+                   ("score", "<f4")])
+
+
+def index_paths(media_path):
+    """Paths of the records, detected frames and key files of `media_path`."""
+    return f"{media_path}.faces.npy", f"{media_path}.faces.frames.npy", f"{media_path}.faces.json"
+
+
+def index_key(media_path, sha256=None):
+    """What the raw detections depend on: the input content and the detector settings."""
+    return {
+        "version": INDEX_VERSION,
+        "sha256": sha256 or file_hash(media_path),
+        "model": os.path.basename(config.face_model_path),
+        "backend": config.detector_backend,
+        "conf_threshold": config.conf_threshold,
+        "iou_threshold": config.iou_threshold,
+    }
+
+
+def _save_array(path, array):
+    """Write `array` atomically (a crash never leaves a half-written index)."""
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+class DetectionIndex:
+    """Raw detections of one input file, loaded from and saved to its sidecar files."""
+
+    def __init__(self, media_path, key=None):
+        """
+        Args:
+            media_path (str): Video or image the detections belong to
+            key (dict): Precomputed `index_key(media_path)` (avoids hashing the file again)
+        """
+        self.records_path, self.frames_path, self.key_path = index_paths(media_path)
+        self.key = key or index_key(media_path)
+        self.records = np.zeros(0, dtype=RECORD)
+        self.detected = np.zeros(0, dtype=np.uint8)
+        self.new = {}  # Frame index -> (N, 5) raw detections not saved yet
+        try:
+            with open(self.key_path, encoding="utf-8") as f:
+                valid = json.load(f) == self.key
+            if valid:
+                self.records = np.load(self.records_path, mmap_mode="r")
+                self.detected = np.load(self.frames_path, mmap_mode="r")
+        except (OSError, ValueError):
+            pass  # No index yet, or unreadable: start from scratch
+
+    def get(self, frame):
+        """Raw (N, 5) detections [x1, y1, x2, y2, score] of `frame`, or None if it was never analyzed."""
+        if frame in self.new:
+            return self.new[frame]
+        if frame >= len(self.detected) or not self.detected[frame]:
+            return None
+        frames = self.records["frame"]
+        rows = self.records[np.searchsorted(frames, frame, "left"):np.searchsorted(frames, frame, "right")]
+        return np.stack([rows["x1"], rows["y1"], rows["x2"], rows["y2"], rows["score"]], axis=1)
+
+    def add(self, frame, detections):
+        self.new[frame] = np.asarray(detections, dtype=np.float32).reshape(-1, 5)
+
+    def detect(self, frames, indices):
+        """
+        Same as `detect_faces_batch`, but only frames missing from the index go through YOLO.
+
+        Args:
+            frames (list[ndarray]): Frames of the input
+            indices (list[int]): Frame index of each frame in the input
+
+        Returns:
+            list[ndarray]: (N, 4) regions (x, y, w, h) with margin, per frame
+        """
+        raw = [self.get(index) for index in indices]
+        missing = [i for i, detections in enumerate(raw) if detections is None]
+        metrics.count("frames.index_hits", len(frames) - len(missing))
+        if missing:
+            with metrics.span("detect.inference"):
+                found = detect_raw_batch([frames[i] for i in missing])
+            metrics.count("frames.detected", len(missing))
+            for i, detections in zip(missing, found):
+                self.add(indices[i], detections)
+                raw[i] = self.new[indices[i]]
+        with metrics.span("detect.boxes"):
+            return [expand_boxes(detections, frame.shape[1], frame.shape[0])
+                    for detections, frame in zip(raw, frames)]
+
+    def save(self):
+        """Merge the new detections into the sidecar files."""
+        if not self.new:
+            return
+        frames = sorted(self.new)
+        added = np.zeros(sum(len(self.new[f]) for f in frames), dtype=RECORD)
+        added["frame"] = np.repeat(frames, [len(self.new[f]) for f in frames])
+        if len(added):
+            stacked = np.concatenate([self.new[f] for f in frames])
+            for i, name in enumerate(("x1", "y1", "x2", "y2", "score")):
+                added[name] = stacked[:, i]
+        # Rows of re-analyzed frames are replaced
+        old = np.array(self.records[~np.isin(self.records["frame"], frames)])
+        records = np.concatenate([old, added])
+        records = records[np.argsort(records["frame"], kind="stable")]
+        detected = np.zeros(max(len(self.detected), frames[-1] + 1), dtype=np.uint8)
+        detected[:len(self.detected)] = self.detected
+        detected[frames] = 1
+        self.records = self.detected = None  # Close the memory maps (needed on Windows)
+
+        # The key is removed first and written last, so a partial update is never trusted
+        if os.path.exists(self.key_path):
+            os.remove(self.key_path)
+        _save_array(self.records_path, records)
+        _save_array(self.frames_path, detected)
+        tmp_path = f"{self.key_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.key, f, indent=1)
+        os.replace(tmp_path, self.key_path)
+        self.records, self.detected, self.new = records, detected, {}
@@ -0,0 +1,234 @@
+"""
+Face detector backends.
+
+Both backends take a list of BGR frames and return, for each frame, an
+(N, 5) float32 array of raw detections [x1, y1, x2, y2, score] in pixels of
+the original frame (no margin).
+
+- `UltralyticsDetector` wraps the generic ultralytics `YOLO` model.
+- `OnnxFaceDetector` runs the ONNX file directly with onnxruntime, letterboxes
+  into preallocated buffers and decodes/NMS the output with NumPy only.
+"""
+
+import ast
+import threading
+
+import cv2
+import numpy as np
+
+import config
+
+_OPTIMIZATION_LEVELS = ("disable", "basic", "extended", "all")
+MAX_NMS = 30000  # Candidates given to NMS, the best first (as ultralytics)
+MAX_DET = 300  # Boxes kept per frame (as ultralytics)
+
+
+def session_options(intra_op_threads=None, inter_op_threads=None, optimization=None):
+    """
+    onnxruntime `SessionOptions` from the config (read at call time, worker processes may have capped the threads).
+
+    Args:
+        intra_op_threads (int): Threads used inside an operator (0 = onnxruntime default)
+        inter_op_threads (int): Threads used across operators (0 = onnxruntime default)
+        optimization (str): Graph optimization level: "disable", "basic", "extended" or "all"
+    """
+    import onnxruntime as ort
+
+    optimization = optimization or config.ort_graph_optimization
+    if optimization not in _OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown optimization level {optimization}, use one of {_OPTIMIZATION_LEVELS}")
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = config.ort_intra_op_threads if intra_op_threads is None else intra_op_threads
+    options.inter_op_num_threads = config.ort_inter_op_threads if inter_op_threads is None else inter_op_threads
+    options.graph_optimization_level = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }[optimization]
+    return options
+
+
+class UltralyticsDetector:
+    """Face detection through ultralytics `YOLO` (not thread-safe, one instance per thread)."""
+
+    def __init__(self, path=None):
+        from ultralytics import YOLO
+        from ultralytics.utils import LOGGER
+        LOGGER.setLevel("ERROR")
+        path = path or config.face_model_path
+        self.model = YOLO(path, task="detect", verbose=False)
+        if path.endswith(".onnx") and (config.ort_intra_op_threads or config.ort_inter_op_threads):
+            self._cap_session_threads(path)
+
+    def _cap_session_threads(self, path):
+        """
+        Replace the onnxruntime session of ultralytics by one with the thread caps of the config.
+
+        ultralytics creates its `InferenceSession` without options, so it uses
+        every core whatever `limit_threads` set (onnxruntime ignores OMP_NUM_THREADS).
+        """
+        import onnxruntime as ort
+
+        self.model(np.zeros((32, 32, 3), dtype=np.uint8))  # Creates the predictor and its session
+        backend = self.model.predictor.model
+        if not getattr(backend, "onnx", False) or backend.cuda:
+            return
+        session = ort.InferenceSession(path, session_options(), providers=["CPUExecutionProvider"])
+        if not backend.dynamic:
+            # Static shapes run through an IO binding, whose outputs are tensors preallocated by ultralytics
+            io = session.io_binding()
+            for output, tensor in zip(session.get_outputs(), backend.bindings):
+                io.bind_output(name=output.name, device_type="cpu", device_id=0,
+                               element_type=np.float16 if "float16" in output.type else np.float32,
+                               shape=tuple(tensor.shape), buffer_ptr=tensor.data_ptr())
+            backend.io = io
+        backend.session = session
+
+    def __call__(self, frames):
+        detections = []
+        for result in self.model(list(frames)):
+            boxes = result.boxes
+            detections.append(np.concatenate([boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy()[:, None]],
+                                             axis=1).astype(np.float32))
+        return detections
+
+
+def nms(boxes, scores, iou_threshold, max_det=MAX_DET, max_nms=MAX_NMS):
+    """
+    Greedy non-maximum suppression.
+
+    Only the `max_nms` best candidates are considered and at most `max_det`
+    boxes are kept (the ultralytics defaults). The IoU is computed between
+    each kept box and the remaining candidates only, so memory stays linear
+    in the number of candidates even in noisy frames.
+
+    Args:
+        boxes (ndarray): (N, 4) boxes [x1, y1, x2, y2]
+        scores (ndarray): (N,) confidences
+        iou_threshold (float): Boxes overlapping a kept box more than this are dropped
+        max_det (int): Maximum number of boxes kept
+        max_nms (int): Maximum number of candidates, the best first
+
+    Returns:
+        ndarray: Indices of the kept boxes, best first
+    """
+    order = np.argsort(-scores, kind="stable")[:max_nms]
+    boxes = boxes[order]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    remaining = np.arange(len(boxes))
+    while len(remaining) and len(keep) < max_det:
+        best, rest = remaining[0], remaining[1:]
+        keep.append(best)
+        ix1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        iy1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        ix2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        iy2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+        iou = inter / np.maximum(areas[best] + areas[rest] - inter, 1e-6)
+        remaining = rest[iou <= iou_threshold]
+    return order[keep]
+
+
+class OnnxFaceDetector:
+    """
+    Face detection with a plain onnxruntime `InferenceSession`.
+
+    `InferenceSession.run` is thread-safe and the input buffers are per thread,
+    so a single instance can be shared by all threads.
+    """
+
+    def __init__(self, path=None, intra_op_threads=None, inter_op_threads=None, optimization=None,
+                 conf_threshold=None, iou_threshold=None):
+        """
+        Args:
+            path (str): ONNX model, defaults to config.face_model_path
+            intra_op_threads (int): Threads used inside an operator (0 = onnxruntime default)
+            inter_op_threads (int): Threads used across operators (0 = onnxruntime default)
+            optimization (str): Graph optimization level: "disable", "basic", "extended" or "all"
+            conf_threshold (float): Minimum face confidence
+            iou_threshold (float): IoU above which overlapping detections are merged by NMS
+        """
+        import onnxruntime as ort
+
+        self.session = ort.InferenceSession(path or config.face_model_path,
+                                            session_options(intra_op_threads, inter_op_threads, optimization),
+                                            providers=["CPUExecutionProvider"])
+        self.conf_threshold = config.conf_threshold if conf_threshold is None else conf_threshold
+        self.iou_threshold = config.iou_threshold if iou_threshold is None else iou_threshold
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        # Dynamic dimensions are reported as strings
+        self.input_size = (height if isinstance(height, int) else 640, width if isinstance(width, int) else 640)
+        self.max_batch = batch if isinstance(batch, int) else None
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        self.num_classes = len(ast.literal_eval(names)) if names else 1
+
+        self._local = threading.local()  # Preallocated buffers of each thread
+
+    def _buffers(self):
+        """Letterbox canvas (BGR) and batch size -> (B, 3, H, W) float32 inputs, for this thread."""
+        if not hasattr(self._local, "canvas"):
+            self._local.canvas = np.full(self.input_size + (3,), 114, dtype=np.uint8)
+            self._local.inputs = {}
+        return self._local.canvas, self._local.inputs
+
+    def _input_buffer(self, batch):
+        inputs = self._buffers()[1]
+        if batch not in inputs:
+            inputs[batch] = np.empty((batch, 3) + self.input_size, dtype=np.float32)
+        return inputs[batch]
+
+    def _letterbox(self, frame, out):
+        """Resize `frame` keeping its ratio into the canvas, write it to `out` as RGB CHW in [0, 1]."""
+        height, width = self.input_size
+        h, w = frame.shape[:2]
+        ratio = min(height / h, width / w)
+        new_w, new_h = round(w * ratio), round(h * ratio)
+        left, top = (width - new_w) // 2, (height - new_h) // 2
+        canvas = self._buffers()[0]
+        canvas[:top] = 114
+        canvas[top + new_h:] = 114
+        canvas[:, :left] = 114
+        canvas[:, left + new_w:] = 114
+        canvas[top:top + new_h, left:left + new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        np.multiply(canvas[:, :, ::-1].transpose(2, 0, 1), 1 / 255.0, out=out, casting="unsafe")
+        return ratio, left, top
+
+    def _decode(self, output, ratio, left, top, frame_shape):
+        """Turn one (4 + classes, anchors) output into (N, 5) [x1, y1, x2, y2, score] in frame pixels."""
+        predictions = output.T  # (anchors, 4 + classes [+ extra])
+        scores = predictions[:, 4:4 + self.num_classes].max(axis=1)
+        candidates = scores > self.conf_threshold
+        predictions, scores = predictions[candidates], scores[candidates]
+        if not len(scores):
+            return np.zeros((0, 5), dtype=np.float32)
+
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        keep = nms(boxes, scores, self.iou_threshold)
+        boxes, scores = boxes[keep], scores[keep]
+
+        # Undo the letterbox
+        boxes -= (left, top, left, top)
+        boxes /= ratio
+        height, width = frame_shape[:2]
+        np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+        return np.concatenate([boxes, scores[:, None]], axis=1).astype(np.float32)
+
+    def __call__(self, frames):
+        frames = list(frames)
+        step = self.max_batch or len(frames) or 1
+        detections = []
+        for start in range(0, len(frames), step):
+            chunk = frames[start:start + step]
+            batch = self._input_buffer(len(chunk) if self.max_batch is None else self.max_batch)
+            transforms = [self._letterbox(frame, batch[i]) for i, frame in enumerate(chunk)]
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+            detections.extend(self._decode(outputs[i], *transform, frame.shape)
+                              for i, (frame, transform) in enumerate(zip(chunk, transforms)))
+        return detections
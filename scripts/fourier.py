@@ -1,7 +1,13 @@
+import tempfile
+import wave
+
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
 from scipy.io import wavfile
 
-from config import band_size, shift_amount
+from scripts import metrics
+from config import band_size, shift_amount, fft_streaming, stream_window, stream_shift_hz, stream_band_hz
 
 def shift_frequencies(spectrum):
     """Décale les fréquences dans le spectre FFT."""
@@ -24,13 +30,10 @@ def permute_frequency_bands(spectrum):
         permuted[start1:start1 + band_size], permuted[start2:start2 + band_size] = vect[:band_size], vect[band_size:]
     return permuted
 
-def fourier_transform(video, extracted_audio_path, output_audio_path):
-    """Extrait l'audio d'une vidéo, applique une transformation FFT et sauvegarde le résultat."""
-    # Charger la vidéo et extraire l'audio
-    video.audio.write_audiofile(extracted_audio_path)
-
+def anonymize_wav_full(input_path, output_path):
+    """Anonymise un fichier WAV avec une seule FFT sur tout le signal (tout est chargé en mémoire)."""
     # Charger l'audio
-    rate, data = wavfile.read(extracted_audio_path)
+    rate, data = wavfile.read(input_path)
 
     # Si stéréo, ne garder qu'un canal
     if data.ndim > 1:
@@ -52,4 +55,125 @@ def fourier_transform(video, extracted_audio_path, output_audio_path):
     modified_data = np.int16(modified_data / np.max(np.abs(modified_data)) * 32767)
 
     # Sauvegarde
-    wavfile.write(output_audio_path, rate, modified_data)
\ No newline at end of file
+    wavfile.write(output_path, rate, modified_data)
+
+def modify_spectra(spectra, shift_bins, band_bins):
+    """
+    Décale et mélange les bandes de fréquences de plusieurs spectres à la fois.
+
+    Paramètres :
+    - spectra : tableau (fenêtres, fréquences) de FFT réelles, modifié en place
+    - shift_bins : décalage fréquentiel en nombre de raies
+    - band_bins : taille des bandes (en raies) moyennées deux à deux
+    """
+    # Décalage fréquentiel, les raies libérées sont mises à zéro
+    if shift_bins > 0:
+        spectra[:, shift_bins:] = spectra[:, :-shift_bins].copy()
+        spectra[:, :shift_bins] = 0
+    elif shift_bins < 0:
+        spectra[:, :shift_bins] = spectra[:, -shift_bins:].copy()
+        spectra[:, shift_bins:] = 0
+
+    # Bandes voisines remplacées par leur moyenne, sur un tableau remodelé (sans boucle)
+    if band_bins > 0:
+        num_pairs = spectra.shape[1] // (2 * band_bins)
+        if num_pairs:
+            end = num_pairs * 2 * band_bins
+            pairs = spectra[:, :end].reshape(len(spectra), num_pairs, 2, band_bins)
+            pairs[...] = pairs.mean(axis=2, keepdims=True)
+    return spectra
+
+def anonymize_wav_stream(input_path, output_path, window=stream_window, shift_hz=stream_shift_hz,
+                         band_hz=stream_band_hz, frames_per_block=256):
+    """
+    Anonymise un fichier WAV par STFT en flux, avec une mémoire constante.
+
+    Le signal est découpé en fenêtres (racine de Hann, recouvrement de 50 %),
+    chaque fenêtre passe par une FFT réelle float32, le spectre est modifié puis
+    reconstruit par overlap-add. Les fenêtres sont traitées par blocs, la FFT
+    d'un bloc étant répartie sur tous les cœurs.
+
+    Paramètres :
+    - input_path, output_path : fichiers WAV d'entrée et de sortie (mono 16 bits)
+    - window : taille des fenêtres en échantillons (paire)
+    - shift_hz : décalage fréquentiel en Hz
+    - band_hz : largeur en Hz des bandes moyennées deux à deux
+    - frames_per_block : nombre de fenêtres traitées à la fois
+    """
+    # Lecture en mmap : le fichier n'est pas chargé en mémoire
+    try:
+        rate, data = wavfile.read(input_path, mmap=True)
+    except ValueError:
+        rate, data = wavfile.read(input_path)
+    # Si stéréo, ne garder qu'un canal
+    if data.ndim > 1:
+        data = data[:, 0]
+    total = len(data)
+
+    hop = window // 2
+    # Racine d'une fenêtre de Hann périodique : analyse x synthèse = Hann, dont la somme à 50 % vaut 1
+    win = np.sqrt(0.5 - 0.5 * np.cos(2 * np.pi * np.arange(window) / window)).astype(np.float32)
+    shift_bins = int(round(shift_hz * window / rate))
+    band_bins = int(round(band_hz * window / rate))
+
+    carry = np.zeros(window - hop, dtype=np.float32)  # Fin du bloc précédent (+ remplissage initial)
+    tail = np.zeros(window - hop, dtype=np.float32)  # Recouvrement de sortie en attente
+    skip = window - hop  # Échantillons de remplissage à retirer en sortie
+    written = 0
+    peak = 0.0
+
+    # Passe 1 : STFT par blocs, résultat float32 dans un fichier temporaire
+    with tempfile.TemporaryFile() as raw:
+        for start in range(0, total + hop, hop * frames_per_block):
+            chunk = np.asarray(data[start:start + hop * frames_per_block], dtype=np.float32)
+            if start + hop * frames_per_block >= total:
+                # Dernier bloc : remplissage pour vider le recouvrement
+                chunk = np.concatenate([chunk, np.zeros(window, dtype=np.float32)])
+            buffer = np.concatenate([carry, chunk])
+            count = (len(buffer) - (window - hop)) // hop
+            if count <= 0:
+                carry = buffer
+                continue
+
+            frames = sliding_window_view(buffer, window)[::hop][:count] * win
+            spectra = modify_spectra(sp_fft.rfft(frames, axis=1, workers=-1), shift_bins, band_bins)
+            frames = sp_fft.irfft(spectra, n=window, axis=1, workers=-1).astype(np.float32) * win
+
+            # Overlap-add vectorisé (chaque fenêtre = deux demi-fenêtres)
+            out = np.zeros(count * hop + hop, dtype=np.float32)
+            out[:hop] += tail
+            out[:count * hop] += frames[:, :hop].ravel()
+            out[hop:] += frames[:, hop:].ravel()
+            tail = out[count * hop:].copy()
+            carry = buffer[count * hop:].copy()
+
+            ready = out[:count * hop][skip:]
+            skip = max(0, skip - count * hop)
+            ready = ready[:total - written]
+            if len(ready):
+                peak = max(peak, float(np.abs(ready).max()))
+                raw.write(ready.tobytes())
+                written += len(ready)
+            if written >= total:
+                break
+
+        # Passe 2 : normalisation et conversion en 16 bits, par blocs
+        scale = 32767 / peak if peak else 0.0
+        raw.seek(0)
+        with wave.open(output_path, "wb") as out_wav:
+            out_wav.setnchannels(1)
+            out_wav.setsampwidth(2)
+            out_wav.setframerate(rate)
+            while True:
+                block = np.frombuffer(raw.read(4 * hop * frames_per_block), dtype=np.float32)
+                if not len(block):
+                    break
+                out_wav.writeframes(np.int16(block * scale).tobytes())
+
+def anonymize_audio(input_path, output_path):
+    """Applique la transformation FFT (en flux ou sur tout le signal, voir config) à un fichier WAV."""
+    with metrics.span("audio.fft"):
+        if fft_streaming:
+            anonymize_wav_stream(input_path, output_path)
+        else:
+            anonymize_wav_full(input_path, output_path)
@@ -1,19 +1,43 @@
 import cv2
 import os
 
-from scripts.detect import detect_and_anonymize_faces
+from config import detection_index, jpeg_quality, png_compression
+from scripts.detect import FaceAnonymizer
+from scripts.detection_index import DetectionIndex
 
-def process_image(image_path, use_blur='pixelate'):
+def output_path_for(image_path):
+    """Chemin de l'image anonymisée : même nom avec `_blurred`, même extension."""
+    base, ext = os.path.splitext(image_path)
+    return f"{base}_blurred{ext}"
+
+def write_params(path):
+    """Paramètres de `cv2.imwrite` selon le format : qualité JPEG ou compression PNG (voir config)."""
+    if path.lower().endswith((".jpg", ".jpeg")):
+        return [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+    if path.lower().endswith(".png"):
+        return [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    return []
+
+def process_image(image_path, use_blur='pixelate', use_index=detection_index):
     """
     Traite une image pour flouter ou pixelliser les visages.
+
+    Avec `use_index`, les détections brutes sont relues depuis l'index de l'image
+    (voir scripts/detection_index.py) : relancer avec un autre style ne relance pas YOLO.
     """
     img = cv2.imread(image_path)
     if img is None:
         print(f"Erreur : impossible de lire l'image {image_path}")
         return
 
-    img = detect_and_anonymize_faces(img, use_blur)
-    base, ext = os.path.splitext(image_path)
-    output_path = f"{base}_blurred{ext}"
-    cv2.imwrite(output_path, img)
+    # Nouvelle session par image : pas de mémoire partagée entre fichiers
+    anonymizer = FaceAnonymizer(use_blur)
+    if use_index:
+        index = DetectionIndex(image_path)
+        img = anonymizer.anonymize(img, index.detect([img], [0])[0])
+        index.save()
+    else:
+        img = anonymizer(img)
+    output_path = output_path_for(image_path)
+    cv2.imwrite(output_path, img, write_params(output_path))
     print(f"Image sauvegardée : {output_path}")
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+Job manifest of the incremental mode (`main.py --incremental`).
+
+A `.blur_manifest.json` file next to the inputs records, for each input:
+- its content hash (plus size and modification time, so that unchanged files
+  are not hashed again on the next run),
+- the fingerprint of the settings its outputs were made with,
+- the stages already completed and their outputs.
+
+An input whose hash, fingerprint and stages all match, and whose outputs
+still exist, is skipped. Otherwise only the stages that are missing (or come
+after a missing one) run again.
+
+Worker processes update the manifest as each stage completes, so the file is
+guarded by a lock file and always replaced atomically.
+"""
+
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import config
+from config import image_exts
+from scripts.transcription import file_hash
+
+MANIFEST_NAME = ".blur_manifest.json"
+GENERATED_SUFFIXES = ("_blurred", "_blurred_anonymized", "_subtitled")  # Outputs of main.process
+IMAGE_STAGES = ("image",)
+VIDEO_STAGES = ("video", "audio", "subtitles")
+# Settings that change the outputs (parallelism and batch sizes do not)
+OUTPUT_SETTINGS = (
+    "pixel_size", "blur_size", "fast_blur", "band_size", "shift_amount", "fft_streaming", "stream_window",
+    "stream_shift_hz", "stream_band_hz", "face_model_path", "detector_backend", "conf_threshold",
+    "iou_threshold", "margin", "face_history", "close_threshold", "scene_cut_threshold", "track_margin",
+    "track_max_misses", "x264_preset", "x264_crf", "WHISPER_MODEL", "WHISPER_LANGUAGE", "TTS_LANGUAGE",
+    "TTS_MODEL_NAME", "vad_enabled", "vad_energy_db", "vad_flatness", "vad_padding", "vad_min_silence",
+    "vad_min_speech", "vad_max_chunk_seconds", "jpeg_quality", "png_compression", "image_reduced_decode",
+)
+_STALE_LOCK_SECONDS = 30  # Updates take milliseconds, an older lock was left by a killed process
+
+
+def is_generated(path):
+    """True for the files written by main.process (they must not be processed again)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem.endswith(GENERATED_SUFFIXES)
+
+
+def stages_for(path):
+    return IMAGE_STAGES if path.lower().endswith(image_exts) else VIDEO_STAGES
+
+
+def config_fingerprint(**options):
+    """Hash of the output settings of `config` and of the processing options (e.g. use_blur)."""
+    settings = {name: getattr(config, name) for name in OUTPUT_SETTINGS}
+    settings.update(options)
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class Manifest:
+    """Completed stages of the inputs of one folder, stored in its `.blur_manifest.json`."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Manifest file, or the folder that holds it
+        """
+        self.path = os.path.join(path, MANIFEST_NAME) if os.path.isdir(path) else path
+        self.root = os.path.dirname(os.path.abspath(self.path))
+
+    @contextmanager
+    def _locked(self):
+        """Hold the manifest lock file (works across threads and processes)."""
+        lock_path = f"{self.path}.lock"
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > _STALE_LOCK_SECONDS:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue  # Released meanwhile
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"inputs": {}}
+
+    def _write(self, data):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _name(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def entry(self, path):
+        """Manifest entry of `path` (empty dict if unknown)."""
+        return self._read()["inputs"].get(self._name(path), {})
+
+    def prepare(self, path, fingerprint):
+        """
+        Record the current hash and fingerprint of `path`, before it is processed.
+
+        Completed stages are kept only if the file and the settings did not
+        change since they were recorded.
+
+        Returns:
+            bool: True if every stage is completed and its outputs exist (nothing to do)
+        """
+        stat = os.stat(path)
+        # Hash without the lock: other processes keep updating the manifest meanwhile
+        known = self.entry(path)
+        if known.get("size") == stat.st_size and known.get("mtime_ns") == stat.st_mtime_ns:
+            sha256 = known["sha256"]  # Unchanged file, skip hashing
+        else:
+            sha256 = file_hash(path)
+        with self._locked():
+            data = self._read()
+            entry = data["inputs"].get(self._name(path), {})
+            if entry.get("sha256") != sha256 or entry.get("fingerprint") != fingerprint:
+                entry = {"sha256": sha256, "fingerprint": fingerprint, "stages": {}}
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            data["inputs"][self._name(path)] = entry
+            self._write(data)
+        return len(self._completed(path, entry)) == len(stages_for(path))
+
+    def _completed(self, path, entry):
+        done = []
+        for stage in stages_for(path):
+            outputs = entry.get("stages", {}).get(stage)
+            if outputs is None or not all(os.path.exists(os.path.join(self.root, o)) for o in outputs):
+                break  # The next stages use this one's outputs, they must run again too
+            done.append(stage)
+        return done
+
+    def completed(self, path):
+        """Stages of `path` already done, in order, whose outputs still exist."""
+        return self._completed(path, self.entry(path))
+
+    def complete(self, path, stage, outputs):
+        """Mark `stage` of `path` as done, with the files it wrote."""
+        with self._locked():
+            data = self._read()
+            entry = data["inputs"].setdefault(self._name(path), {})
+            entry.setdefault("stages", {})[stage] = [self._name(output) for output in outputs]
+            self._write(data)
+
+    def checkpoint_key(self, path):
+        """Identifies the partial results of `path` that can be resumed (same content, same settings)."""
+        entry = self.entry(path)
+        return f"{entry.get('sha256')}-{entry.get('fingerprint')}"
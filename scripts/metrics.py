@@ -0,0 +1,185 @@
+"""
+Lightweight timing and counters of the pipeline steps.
+
+Metrics are off by default: `span` then returns a shared no-op context manager
+and `count`/`observe` return immediately, so the instrumented code costs a
+function call and a flag check. `enable()` turns them on for this process and,
+through the BLUR_METRICS environment variable, for the worker processes it
+spawns afterwards.
+
+Three kinds of values are kept, by name:
+- spans: wall time of a block (count, total, min, max seconds)
+- counters: sums (frames, bytes read and written, ...)
+- observations: distribution of a value (count, sum, min, max), e.g. faces per frame
+
+`snapshot()` returns them as a JSON-ready dict, `merge()` adds the snapshot of
+another process (chunk or file workers) into this one.
+"""
+
+import contextlib
+import json
+import os
+import subprocess
+import threading
+import time
+
+_ENV = "BLUR_METRICS"
+_enabled = os.environ.get(_ENV) == "1"
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_observations = {}
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def enable():
+    """Turn metrics on, in this process and in the processes spawned from now on."""
+    global _enabled
+    _enabled = True
+    os.environ[_ENV] = "1"
+
+
+def enabled():
+    return _enabled
+
+
+def _add(table, name, value):
+    with _lock:
+        stats = table.get(name)
+        if stats is None:
+            table[name] = [1, value, value, value]
+        else:
+            stats[0] += 1
+            stats[1] += value
+            stats[2] = min(stats[2], value)
+            stats[3] = max(stats[3], value)
+
+
+def record(name, seconds):
+    """Add a duration measured elsewhere to the span `name`."""
+    if _enabled:
+        _add(_spans, name, seconds)
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _add(_spans, self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name):
+    """Context manager timing its block under `name`."""
+    return _Span(name) if _enabled else _NULL_SPAN
+
+
+def count(name, value=1):
+    """Add `value` to the counter `name`."""
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value):
+    """Record one value of the distribution `name`."""
+    if _enabled:
+        _add(_observations, name, value)
+
+
+def count_file_bytes(name, *paths):
+    """Add the size of the existing `paths` to the counter `name` (e.g. bytes_read)."""
+    if _enabled:
+        count(name, sum(os.path.getsize(path) for path in paths if path and os.path.isfile(path)))
+
+
+def run(command, name=None, cancel=None, **kwargs):
+    """
+    `subprocess.run` recording its wall time as the span `subprocess.<name>` (default: the program).
+
+    With `cancel` (a threading.Event), the process is killed when it is set (see scripts/cancel.py).
+    """
+    with span(f"subprocess.{name or os.path.basename(command[0])}"):
+        if cancel is not None:
+            from scripts.cancel import run_process
+            return run_process(command, cancel, **kwargs)
+        return subprocess.run(command, **kwargs)
+
+
+def _stats(table, total_key):
+    return {name: {"count": c, total_key: t, "min": lo, "max": hi} for name, (c, t, lo, hi) in table.items()}
+
+
+def _load(table, stats, total_key):
+    table.clear()
+    table.update({name: [s["count"], s[total_key], s["min"], s["max"]] for name, s in stats.items()})
+
+
+def snapshot():
+    """Current metrics of this process as a JSON-ready dict."""
+    with _lock:
+        return {"spans": _stats(_spans, "total"), "counters": dict(_counters),
+                "observations": _stats(_observations, "sum")}
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _observations.clear()
+
+
+def merge(other):
+    """Add a snapshot (e.g. from a worker process) to the metrics of this process."""
+    if not other:
+        return
+    with _lock:
+        merged = combine([{"spans": _stats(_spans, "total"), "counters": _counters,
+                           "observations": _stats(_observations, "sum")}, other])
+        _load(_spans, merged["spans"], "total")
+        _load(_observations, merged["observations"], "sum")
+        _counters.update(merged["counters"])
+
+
+def combine(snapshots):
+    """Sum several snapshots (e.g. the per-file metrics of a run) without touching this process."""
+    total = {"spans": {}, "counters": {}, "observations": {}}
+    for other in snapshots:
+        if not other:
+            continue
+        for key, total_key in (("spans", "total"), ("observations", "sum")):
+            for name, s in other.get(key, {}).items():
+                mine = total[key].setdefault(name, {"count": 0, total_key: 0, "min": s["min"], "max": s["max"]})
+                mine["count"] += s["count"]
+                mine[total_key] += s[total_key]
+                mine["min"] = min(mine["min"], s["min"])
+                mine["max"] = max(mine["max"], s["max"])
+        for name, value in other.get("counters", {}).items():
+            total["counters"][name] = total["counters"].get(name, 0) + value
+    return total
+
+
+def write_report(path, results, shared=None):
+    """
+    Write the metrics of a run as JSON: one entry per file, and their sum.
+
+    Args:
+        path (str): Output JSON file
+        results (list[tuple]): (path, seconds, error, snapshot) per file, as returned by `run_files`
+        shared (dict): Snapshot of work done for several files at once (bulk images), only in the total
+    """
+    files = [{"path": file_path, "seconds": seconds, "ok": error is None, "metrics": snapshot}
+             for file_path, seconds, error, snapshot in results]
+    report = {"files": files, "total": combine([entry["metrics"] for entry in files] + [shared])}
+    if shared:
+        report["shared"] = shared
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Metrics saved : {path}")
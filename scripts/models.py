@@ -0,0 +1,94 @@
+"""
+Lazy registry of the models used by the pipeline.
+
+Nothing heavy is imported when this module is loaded: the face detector,
+Whisper and TTS models (and torch/ultralytics with them) are only loaded the
+first time they are needed, then kept resident for the rest of the process.
+"""
+
+import threading
+from contextlib import contextmanager
+
+import config
+from config import WHISPER_MODEL, TTS_MODEL_NAME
+
+# One lock per model family, so that loading Whisper does not block face detection
+_face_lock = threading.Lock()
+_whisper_lock = threading.Lock()
+_tts_lock = threading.Lock()
+_idle_face_models = []  # Loaded ultralytics detectors not currently used by a thread
+_shared_face_model = None  # onnxruntime detector, shared by all threads
+_whisper_models = {}
+_tts_models = {}
+
+
+@contextmanager
+def face_model():
+    """
+    Borrow a face detector (see scripts/detectors.py) for the duration of a `with` block.
+
+    The backend is chosen by config.detector_backend. The onnxruntime detector
+    is thread-safe and shared. ultralytics predictors are not, so each
+    concurrent caller gets its own instance; instances are returned to a pool
+    afterwards and reused, so a model is only loaded when more threads than
+    ever before detect at once.
+    """
+    global _shared_face_model
+    if config.detector_backend == "onnxruntime":
+        with _face_lock:
+            if _shared_face_model is None:
+                from scripts.detectors import OnnxFaceDetector
+                _shared_face_model = OnnxFaceDetector()
+        yield _shared_face_model
+        return
+    if config.detector_backend != "ultralytics":
+        raise ValueError(f"Unknown detector backend {config.detector_backend}, use 'ultralytics' or 'onnxruntime'")
+
+    with _face_lock:
+        model = _idle_face_models.pop() if _idle_face_models else None
+    if model is None:
+        from scripts.detectors import UltralyticsDetector
+        model = UltralyticsDetector()
+    try:
+        yield model
+    finally:
+        with _face_lock:
+            _idle_face_models.append(model)
+
+
+def whisper_model(name=WHISPER_MODEL):
+    """Return the Whisper model `name`, loading it on first use."""
+    with _whisper_lock:
+        if name not in _whisper_models:
+            import whisper
+            _whisper_models[name] = whisper.load_model(name)
+        return _whisper_models[name]
+
+
+def tts_model(name=TTS_MODEL_NAME):
+    """Return the Coqui TTS model `name`, loading it on first use."""
+    with _tts_lock:
+        if name not in _tts_models:
+            import collections
+            import torch
+            from TTS.api import TTS
+            from TTS.config.shared_configs import BaseDatasetConfig
+            from TTS.tts.configs.xtts_config import XttsConfig
+            from TTS.tts.models.xtts import XttsAudioConfig, XttsArgs
+            from TTS.utils.radam import RAdam
+
+            # Classes stored in the TTS checkpoints, needed by torch.load(weights_only=True)
+            torch.serialization.add_safe_globals([XttsConfig, XttsAudioConfig, BaseDatasetConfig, XttsArgs,
+                                                  RAdam, collections.defaultdict, dict])
+            _tts_models[name] = TTS(model_name=name, progress_bar=False, gpu=False)
+        return _tts_models[name]
+
+
+def preload(whisper=False, tts=False):
+    """Load the models up front (e.g. when a worker process starts)."""
+    with face_model():
+        pass
+    if whisper:
+        whisper_model()
+    if tts:
+        tts_model()
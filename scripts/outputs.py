@@ -0,0 +1,98 @@
+"""
+Output files of a video, all derived from a single H.264 encode.
+
+Only the frame pipeline encodes the video stream (scripts/video.py, into
+`_blurred`, together with the original audio). The other variants copy that
+stream (`-c:v copy`) and only encode audio or add a track:
+
+- `_blurred_anonymized`: the `_blurred` video stream with the anonymized audio (AAC)
+- `_subtitled`: the `_blurred_anonymized` streams plus a soft subtitle track
+  (mov_text, can be turned on and off in the player). With `burn=True` the
+  subtitles are drawn into the frames instead, which needs a second encode.
+"""
+
+import os
+
+from config import burn_subtitles, x264_crf, x264_preset
+from scripts import metrics
+
+
+def video_outputs(path):
+    """
+    Paths of the files written for the video `path`.
+
+    Returns:
+        dict: "blurred", "anonymized", "subtitled" (videos), "srt" and "transcript"
+    """
+    base, ext = os.path.splitext(path)
+    return {
+        "blurred": f"{base}_blurred{ext}",  # Video with blurred faces and original audio
+        "anonymized": f"{base}_blurred_anonymized{ext}",
+        "subtitled": f"{base}_subtitled{ext}",
+        "srt": f"{base}_subtitled.srt",
+        "transcript": f"{base}_transcript.json",  # Whisper segments, reused by later runs
+    }
+
+
+def replace_audio(video_path, audio_path, output_path):
+    """
+    Copy the video stream of `video_path` with `audio_path` as its audio track (encoded to AAC).
+
+    Args:
+        video_path (str): Video whose stream is copied
+        audio_path (str): New audio track (e.g. WAV)
+        output_path (str): Output video
+    """
+    command = [
+        "ffmpeg",
+        "-y",
+        "-loglevel", "error",
+        "-i", video_path,
+        "-i", audio_path,
+        "-map", "0:v:0",
+        "-map", "1:a:0",
+        "-c:v", "copy",
+        "-c:a", "aac",
+        output_path
+    ]
+    metrics.run(command, name="ffmpeg_mux", check=True)
+
+
+def add_subtitles(video_path, srt_path, output_path, burn=burn_subtitles):
+    """
+    Add subtitles to a video.
+
+    Args:
+        video_path (str): Path to input video file
+        srt_path (str): Path to SRT subtitle file
+        output_path (str): Path for output video with subtitles
+        burn (bool): Draw the subtitles into the frames (re-encodes the video)
+                     instead of adding a soft subtitle track (stream copy)
+    """
+    command = [
+        "ffmpeg",
+        "-y",  # Overwrite output file if it exists
+        "-loglevel", "error",
+        "-i", video_path,
+    ]
+    if os.path.getsize(srt_path) == 0:
+        # Nobody speaks (ffmpeg refuses empty SRT files): same video, without subtitles
+        command += ["-c", "copy"]
+    elif burn:
+        command += [
+            "-vf", f"subtitles={srt_path}",
+            "-c:v", "libx264",
+            "-preset", x264_preset,
+            "-crf", str(x264_crf),
+            "-c:a", "copy",
+        ]
+    else:
+        command += [
+            "-i", srt_path,
+            "-map", "0",
+            "-map", "1:s:0",
+            "-c", "copy",
+            "-c:s", "mov_text",  # Subtitle codec of MP4/MOV containers
+        ]
+    command.append(output_path)
+    metrics.run(command, name="ffmpeg_subtitles", check=True)
@@ -0,0 +1,137 @@
+"""
+Run `main.process` over many files, serially or in a pool of worker processes.
+
+Files are scheduled largest first so that a long video does not end up alone
+at the tail of the run. Each worker loads the models once and caps the number
+of threads used by native libraries, so N workers do not oversubscribe the
+machine. Errors are collected per file instead of aborting the whole run.
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scripts import metrics
+
+_thread_limit = None  # Cap set by limit_threads in this process
+_in_worker = False  # True in the processes started by run_files and process_video_chunked
+
+
+def limit_threads(threads):
+    """
+    Cap the number of threads used by OpenMP/BLAS, OpenCV, torch and the
+    onnxruntime session of the face detector (either backend) in this process.
+
+    Environment variables only take effect for libraries loaded afterwards, so
+    this should run before the models are loaded.
+    """
+    global _thread_limit
+    threads = max(1, int(threads))
+    _thread_limit = threads
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import config
+    config.ort_intra_op_threads = threads
+    import cv2
+    cv2.setNumThreads(threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def thread_limit():
+    """Threads this process may use: the cap set by `limit_threads`, else the CPU count."""
+    return _thread_limit or os.cpu_count() or 1
+
+
+def nested_workers(workers):
+    """
+    Number of processes a pool started from this process may use.
+
+    A worker of `run_files` already shares the machine with the other workers,
+    so it runs everything itself instead of starting pools of its own (1).
+    """
+    return 1 if _in_worker else workers
+
+
+def init_worker(threads, preload_whisper):
+    """Worker initializer: cap threads then load the models once for the worker's lifetime."""
+    global _in_worker
+    _in_worker = True
+    limit_threads(threads)
+    from scripts.models import preload
+    preload(whisper=preload_whisper)
+
+
+def _timed_call(function, path, kwargs):
+    """
+    Run `function(path, **kwargs)` without raising.
+
+    Returns (path, seconds, error, metrics), metrics being the snapshot of this
+    file only when they are enabled (see scripts/metrics.py), None otherwise.
+    """
+    metrics.reset()
+    start = time.perf_counter()
+    try:
+        function(path, **kwargs)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    seconds = time.perf_counter() - start
+    return path, seconds, error, metrics.snapshot() if metrics.enabled() else None
+
+
+def schedule(paths):
+    """Sort files largest first (by size on disk)."""
+    return sorted(paths, key=os.path.getsize, reverse=True)
+
+
+def run_files(function, paths, workers=1, threads=None, preload_whisper=False, **kwargs):
+    """
+    Call `function(path, **kwargs)` for every path.
+
+    Args:
+        function (callable): Module-level function processing one file (picklable)
+        paths (list[str]): Files to process
+        workers (int): Number of worker processes, 1 runs everything in this process
+        threads (int): Threads per worker, defaults to the CPU count divided by `workers`
+        preload_whisper (bool): Load the Whisper model when each worker starts
+
+    Returns:
+        list[tuple]: (path, seconds, error, metrics) per file, in completion order; error is None on success
+    """
+    paths = schedule(paths)
+    if workers <= 1 or len(paths) <= 1:
+        return [_timed_call(function, path, kwargs) for path in paths]
+
+    workers = min(workers, len(paths))
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    # "spawn" so that each worker creates its own ONNX/torch sessions instead of
+    # inheriting the parent's thread pools through fork
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_worker, initargs=(threads, preload_whisper)) as pool:
+        futures = [pool.submit(_timed_call, function, path, kwargs) for path in paths]
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception:
+                # The worker itself died (e.g. out of memory)
+                path = paths[futures.index(future)]
+                results.append((path, 0.0, traceback.format_exc(), None))
+            path, seconds, error, _ = results[-1]
+            print(f"{'❌' if error else '✅'} {os.path.basename(path)} ({seconds:.1f}s)")
+    return results
+
+
+def print_summary(results):
+    """Print the wall time of every file and the errors of the failed ones."""
+    failures = [result for result in results if result[2]]
+    print(f"\n{len(results) - len(failures)}/{len(results)} files processed")
+    for path, seconds, error, _ in sorted(results, key=lambda result: -result[1]):
+        print(f"  {seconds:8.1f}s  {'FAILED' if error else 'ok':6}  {path}")
+    for path, _, error, _ in failures:
+        print(f"\n--- {path} ---\n{error}")
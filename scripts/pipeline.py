@@ -0,0 +1,153 @@
+"""
+Threaded decode -> detect -> encode pipeline.
+
+Each stage runs on its own thread and stages are connected by bounded queues,
+so a slow stage applies backpressure on the previous one instead of letting
+decoded frames pile up in memory. OpenCV decode/encode and ONNX Runtime release
+the GIL, so the three stages really overlap.
+"""
+
+import queue
+import threading
+import time
+
+_END = object()  # Sentinel sent downstream once the reader is exhausted
+
+
+class StageStats:
+    """Frame count and busy time of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0  # Seconds spent doing actual work (waits excluded)
+
+    @property
+    def fps(self):
+        return self.frames / self.busy if self.busy else 0.0
+
+    def __str__(self):
+        return f"{self.name}: {self.frames} frames, {self.busy:.2f}s busy, {self.fps:.1f} fps"
+
+
+def _put(q, item, stop):
+    """Put `item` on `q`, giving up if the pipeline is being stopped."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    """Get the next item from `q`, or `_END` if the pipeline is being stopped."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def run_pipeline(read_frame, process_batch, write_frame, batch_size=1, queue_size=32, on_written=None):
+    """
+    Run reader, inference and writer stages on separate threads.
+
+    Args:
+        read_frame (callable): Returns the next frame, or None when the input is exhausted
+        process_batch (callable): Takes a list of frames, returns the processed frames in the same order
+        write_frame (callable): Writes one processed frame
+        batch_size (int): Number of frames handed to `process_batch` at once
+        queue_size (int): Maximum number of frames buffered between two stages
+        on_written (callable): Optional callback called with the number of frames just written
+
+    Returns:
+        list[StageStats]: Throughput of the read, process and write stages
+
+    Raises:
+        Exception: The first error raised by any stage, after all threads have stopped
+    """
+    batch_size = max(1, batch_size)
+    # Queues hold batches, size them so that roughly `queue_size` frames are in flight
+    max_batches = max(1, queue_size // batch_size)
+    decoded = queue.Queue(maxsize=max_batches)
+    processed = queue.Queue(maxsize=max_batches)
+    stop = threading.Event()
+    errors = []
+    stats = [StageStats("read"), StageStats("process"), StageStats("write")]
+
+    def fail(exc):
+        errors.append(exc)
+        stop.set()
+
+    def reader():
+        try:
+            batch = []
+            while True:
+                start = time.perf_counter()
+                frame = read_frame()
+                stats[0].busy += time.perf_counter() - start
+                if frame is not None:
+                    batch.append(frame)
+                    stats[0].frames += 1
+                if batch and (frame is None or len(batch) == batch_size):
+                    if not _put(decoded, batch, stop):
+                        return
+                    batch = []
+                if frame is None:
+                    _put(decoded, _END, stop)
+                    return
+        except Exception as exc:
+            fail(exc)
+
+    def processor():
+        try:
+            while True:
+                batch = _get(decoded, stop)
+                if batch is _END:
+                    _put(processed, _END, stop)
+                    return
+                start = time.perf_counter()
+                batch = process_batch(batch)
+                stats[1].busy += time.perf_counter() - start
+                stats[1].frames += len(batch)
+                if not _put(processed, batch, stop):
+                    return
+        except Exception as exc:
+            fail(exc)
+
+    def writer():
+        try:
+            while True:
+                batch = _get(processed, stop)
+                if batch is _END:
+                    return
+                start = time.perf_counter()
+                for frame in batch:
+                    write_frame(frame)
+                stats[2].busy += time.perf_counter() - start
+                stats[2].frames += len(batch)
+                if on_written is not None:
+                    on_written(len(batch))
+        except Exception as exc:
+            fail(exc)
+
+    threads = [threading.Thread(target=target, name=f"pipeline-{stat.name}", daemon=True)
+               for target, stat in zip((reader, processor, writer), stats)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except BaseException:
+        # KeyboardInterrupt on the main thread: let the stages unwind before leaving
+        stop.set()
+        for thread in threads:
+            thread.join()
+        raise
+
+    if errors:
+        raise errors[0]
+    return stats
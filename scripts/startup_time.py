@@ -0,0 +1,75 @@
+"""
+Script to measure the startup cost of the command line entry points.
+
+Each module is imported in a fresh interpreter with `-X importtime`. The script
+prints the total import time, the slowest imports, and fails if a heavy
+library (torch, ultralytics, whisper, TTS, moviepy) is imported at startup or
+if the time is above `--max-seconds`.
+
+Usage: python -m scripts.startup_time --max-seconds 0.5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ENTRY_MODULES = ("main", "scripts.image", "scripts.video")
+HEAVY_MODULES = ("torch", "ultralytics", "whisper", "TTS", "moviepy")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module):
+    """
+    Import `module` in a new interpreter.
+
+    Returns:
+        tuple: (total seconds, list of (seconds, name) per imported module, heavy modules loaded)
+    """
+    code = (f"import sys; import {module}; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = []
+    total = 0.0
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        seconds = int(cumulative) / 1e6
+        if not name.startswith("  "):  # Top level import
+            total += seconds
+        times.append((seconds, name.strip()))
+    heavy = [name for name in result.stdout.strip().split(",") if name]
+    return total, sorted(times, reverse=True), heavy
+
+
+def help_time():
+    """Wall time of `python main.py --help`."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "main.py", "--help"], cwd=ROOT, capture_output=True, check=True)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the import time of the CLI entry points.")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail if an entry point imports slower than this.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports to show.")
+    args = parser.parse_args()
+
+    failed = False
+    for module in ENTRY_MODULES:
+        total, times, heavy = import_times(module)
+        print(f"{module}: {total:.3f}s")
+        for seconds, name in times[:args.top]:
+            print(f"    {seconds:.3f}s  {name}")
+        if heavy:
+            print(f"    ❌ heavy modules imported at startup : {', '.join(heavy)}")
+            failed = True
+        if args.max_seconds is not None and total > args.max_seconds:
+            print(f"    ❌ above {args.max_seconds:.3f}s")
+            failed = True
+    print(f"python main.py --help: {help_time():.3f}s")
+    sys.exit(1 if failed else 0)
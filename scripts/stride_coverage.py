@@ -0,0 +1,77 @@
+"""
+Script to measure how much face coverage is lost when YOLO only runs every N
+frames (keyframe mode) compared with per-frame detection.
+
+Every frame goes through YOLO to get the reference boxes. Keyframe trackers
+are then replayed with those same detections on their keyframes only, and the
+share of each reference face area that they still anonymize is reported.
+
+Usage: python -m scripts.stride_coverage video.mp4 --strides 2 3 5
+"""
+
+import argparse
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from config import batch_size
+from scripts.detect import detect_faces_batch
+from scripts.tracking import KeyframeTracker
+
+
+def box_coverage(reference, boxes, height, width):
+    """Fraction of each reference box (x, y, w, h) covered by the union of `boxes`."""
+    mask = np.zeros((height, width), dtype=bool)
+    for x, y, w, h in boxes:
+        mask[y:y + h, x:x + w] = True
+    return [mask[y:y + h, x:x + w].mean() if w and h else 1.0 for x, y, w, h in reference]
+
+
+def measure_coverage(video_path, strides):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Impossible d'ouvrir la vidéo {video_path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    trackers = {stride: KeyframeTracker(stride=stride) for stride in strides}
+    coverage = {stride: [] for stride in strides}
+    keyframes = {stride: 0 for stride in strides}
+    frame_count = 0
+
+    with tqdm(total=total_frames, desc="Mesure de la couverture") as pbar:
+        while True:
+            frames = []
+            while len(frames) < batch_size:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            if not frames:
+                break
+            for frame, reference in zip(frames, detect_faces_batch(frames)):
+                height, width = frame.shape[:2]
+                for stride, tracker in trackers.items():
+                    key = tracker.plan([frame])[0]
+                    keyframes[stride] += key
+                    boxes = tracker.update(frame, reference if key else None)
+                    coverage[stride].extend(box_coverage(reference, boxes, height, width))
+            frame_count += len(frames)
+            pbar.update(len(frames))
+    cap.release()
+    return frame_count, keyframes, coverage
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare keyframe detection with per-frame detection.")
+    parser.add_argument("path", help="Path to a video.")
+    parser.add_argument("--strides", type=int, nargs="+", default=[2, 3, 5], help="Detection strides to evaluate.")
+    args = parser.parse_args()
+
+    frame_count, keyframes, coverage = measure_coverage(args.path, args.strides)
+    print(f"{frame_count} frames, {sum(map(len, coverage.values())) // max(1, len(coverage))} reference faces")
+    for stride in args.strides:
+        values = np.array(coverage[stride]) if coverage[stride] else np.ones(1)
+        print(f"stride {stride}: YOLO on {keyframes[stride] / max(1, frame_count):.0%} of frames, "
+              f"mean coverage {values.mean():.2%}, "
+              f"faces not fully covered {(values < 0.99).mean():.2%}, "
+              f"worst {values.min():.2%}")
@@ -1,5 +1,4 @@
-import whisper
-import subprocess
+from scripts.transcription import transcribe
 
 def format_timestamp(seconds):
     """
@@ -20,24 +19,17 @@ def format_timestamp(seconds):
     # Return formatted timestamp string
     return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
 
-def generate_subtitles(audio_path, srt_path):
+def write_srt(segments, srt_path):
     """
-    Generate SRT subtitle file from audio using OpenAI Whisper speech recognition.
-    
+    Write transcription segments to an SRT subtitle file.
+
     Args:
-        audio_path (str): Path to input audio file
+        segments (list[dict]): Segments with "start", "end" (seconds) and "text"
         srt_path (str): Path for output SRT subtitle file
     """
-    # Load Whisper model (base model provides good balance of speed and accuracy)
-    model = whisper.load_model("small")
-    
-    # Transcribe the audio file
-    result = model.transcribe(audio_path)
-    
-    # Write transcription results to SRT file
     with open(srt_path, "w", encoding="utf-8") as f:
         # Process each transcribed segment
-        for i, segment in enumerate(result["segments"]):
+        for i, segment in enumerate(segments):
             # Extract timing and text information
             start = segment["start"]
             end = segment["end"]
@@ -48,22 +40,19 @@ def generate_subtitles(audio_path, srt_path):
             f.write(f"{format_timestamp(start)} --> {format_timestamp(end)}\n")
             f.write(f"{text}\n\n")
 
-def add_subtitles(video_path, srt_path, output_path):
+def generate_subtitles(audio_path, srt_path, transcript_path=None, cancel=None):
     """
-    Add subtitles to a video file using FFmpeg.
+    Generate SRT subtitle file from audio using OpenAI Whisper speech recognition.
     
     Args:
-        video_path (str): Path to input video file
-        srt_path (str): Path to SRT subtitle file
-        output_path (str): Path for output video with subtitles
+        audio_path (str): Path to input audio file
+        srt_path (str): Path for output SRT subtitle file
+        transcript_path (str): Optional JSON file caching the transcript between runs
+        cancel (threading.Event): Stops the transcription when set, nothing is written then
+
+    Returns:
+        list[dict]: The transcribed segments
     """
-    command = [
-        "ffmpeg",
-        "-y",  # Overwrite output file if it exists
-        "-i", video_path,
-        "-vf", f"subtitles={srt_path}",
-        "-c:v", "libx264",
-        "-c:a", "aac",
-        output_path
-    ]
-    subprocess.run(command, check=True)
\ No newline at end of file
+    segments = transcribe(audio_path, transcript_path, cancel=cancel)
+    write_srt(segments, srt_path)
+    return segments
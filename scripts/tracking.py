@@ -0,0 +1,159 @@
+"""
+Keyframe face detection with lightweight tracking in between.
+
+YOLO only runs every `detect_stride` frames, or as soon as a scene cut is
+detected. On the other frames, face boxes are carried forward with sparse
+Lucas-Kanade optical flow and slightly enlarged to absorb tracking errors.
+"""
+
+import cv2
+import numpy as np
+
+from config import detect_stride, scene_cut_threshold, track_margin, track_max_misses
+
+TRACK_WIDTH = 640  # Optical flow runs on frames downscaled to this width
+MATCH_IOU = 0.3  # Minimum IoU for a detection to take over an existing track
+
+_LK_PARAMS = dict(winSize=(21, 21), maxLevel=3,
+                  criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+
+def frame_signature(frame):
+    """Normalized grayscale histogram of a thumbnail, used to detect scene cuts."""
+    thumb = cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([gray], [0], None, [32], [0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+def is_scene_cut(previous_signature, signature, threshold=scene_cut_threshold):
+    """Return True if the Bhattacharyya distance between two signatures exceeds `threshold`."""
+    if previous_signature is None:
+        return True
+    return cv2.compareHist(previous_signature, signature, cv2.HISTCMP_BHATTACHARYYA) > threshold
+
+
+def box_iou(a, b):
+    """IoU between (x, y, w, h) boxes `a` (N, 4) and `b` (M, 4), as an (N, M) array."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum((a[:, 0] + a[:, 2])[:, None], (b[:, 0] + b[:, 2])[None, :])
+    iy2 = np.minimum((a[:, 1] + a[:, 3])[:, None], (b[:, 1] + b[:, 3])[None, :])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class KeyframeTracker:
+    """
+    Decide which frames need a YOLO pass and track faces on the others.
+
+    Frames of a stream must go through `plan` (in batches) and then `update`
+    (one by one), both in stream order.
+    """
+
+    def __init__(self, stride=detect_stride, cut_threshold=scene_cut_threshold,
+                 margin=track_margin, max_misses=track_max_misses):
+        """
+        Args:
+            stride (int): Run the detector every `stride` frames
+            cut_threshold (float): Histogram distance above which a frame starts a new scene
+            margin (float): Extra margin (fraction of the box size) added to tracked boxes
+            max_misses (int): Keyframes a track survives without being re-detected
+        """
+        self.stride = max(1, stride)
+        self.cut_threshold = cut_threshold
+        self.margin = margin
+        self.max_misses = max_misses
+
+        # State used by `plan`
+        self._plan_signature = None
+        self._since_keyframe = 0
+
+        # State used by `update`
+        self._prev_gray = None
+        self._scale = 1.0
+        self.boxes = np.zeros((0, 4), dtype=np.float32)  # Tracked (x, y, w, h), full resolution
+        self.age = np.zeros(0, dtype=np.int32)  # Frames since each box was last detected
+        self.misses = np.zeros(0, dtype=np.int32)  # Keyframes since each box was last detected
+
+    def plan(self, frames):
+        """
+        Return, for each frame of the batch, whether it must go through the detector.
+        """
+        keyframes = []
+        for frame in frames:
+            signature = frame_signature(frame)
+            cut = is_scene_cut(self._plan_signature, signature, self.cut_threshold)
+            key = cut or self._since_keyframe >= self.stride - 1
+            self._since_keyframe = 0 if key else self._since_keyframe + 1
+            self._plan_signature = signature
+            keyframes.append(key)
+        return keyframes
+
+    def _gray(self, frame):
+        height, width = frame.shape[:2]
+        self._scale = min(1.0, TRACK_WIDTH / width)
+        small = frame if self._scale == 1.0 else cv2.resize(
+            frame, (round(width * self._scale), round(height * self._scale)), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def _propagate(self, gray):
+        """Move every tracked box by the median optical flow of a grid of points inside it."""
+        if self._prev_gray is None or not len(self.boxes):
+            return
+        # 3x3 grid of points per box, in the downscaled frame
+        steps = np.array([0.2, 0.5, 0.8], dtype=np.float32)
+        gx, gy = np.meshgrid(steps, steps)
+        offsets = np.stack([gx.ravel(), gy.ravel()], axis=1)
+        boxes = self.boxes * self._scale
+        points = boxes[:, None, :2] + offsets[None, :, :] * boxes[:, None, 2:]
+        points = points.reshape(-1, 1, 2).astype(np.float32)
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None, **_LK_PARAMS)
+        flow = (moved - points).reshape(len(boxes), -1, 2)
+        valid = status.reshape(len(boxes), -1).astype(bool)
+        for i in range(len(boxes)):
+            if valid[i].any():
+                self.boxes[i, :2] += np.median(flow[i][valid[i]], axis=0) / self._scale
+
+    def update(self, frame, detections=None):
+        """
+        Advance the tracker by one frame.
+
+        Args:
+            frame (ndarray): Current frame
+            detections (list): Boxes (x, y, w, h) found by the detector on this frame,
+                or None if this frame was not a keyframe
+
+        Returns:
+            list[tuple]: Boxes (x, y, w, h) to anonymize on this frame
+        """
+        height, width = frame.shape[:2]
+        gray = self._gray(frame)
+        self._propagate(gray)
+        self._prev_gray = gray
+        self.age += 1
+
+        if detections is not None:
+            detected = np.asarray(detections, dtype=np.float32).reshape(-1, 4)
+            # Tracks overlapping a new detection are replaced by it, the others
+            # survive a few keyframes in case the detector missed the face
+            overlap = box_iou(self.boxes, detected)
+            unmatched = ~(overlap >= MATCH_IOU).any(axis=1) if len(detected) else np.ones(len(self.boxes), bool)
+            self.misses[unmatched] += 1
+            keep = unmatched & (self.misses <= self.max_misses)
+            self.boxes = np.concatenate([detected, self.boxes[keep]])
+            self.age = np.concatenate([np.zeros(len(detected), np.int32), self.age[keep]])
+            self.misses = np.concatenate([np.zeros(len(detected), np.int32), self.misses[keep]])
+
+        # Boxes that were not detected on this frame get a safety margin
+        pad = np.where(self.age[:, None] > 0, self.boxes[:, 2:] * self.margin, 0.0)
+        x1 = np.clip(self.boxes[:, 0] - pad[:, 0], 0, width)
+        y1 = np.clip(self.boxes[:, 1] - pad[:, 1], 0, height)
+        x2 = np.clip(self.boxes[:, 0] + self.boxes[:, 2] + pad[:, 0], 0, width)
+        y2 = np.clip(self.boxes[:, 1] + self.boxes[:, 3] + pad[:, 1], 0, height)
+        faces = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).astype(int)
+        return [tuple(face) for face in faces.tolist() if face[2] > 0 and face[3] > 0]
@@ -0,0 +1,193 @@
+"""
+Transcription service shared by the subtitles and the TTS anonymization.
+
+Each video is transcribed once with Whisper. The segments are saved next to the
+outputs, with the hash of the audio, the model name and the language, so that
+a rerun on the same audio skips Whisper entirely.
+
+With `vad_enabled`, only the passages with speech are given to Whisper (see
+scripts/vad.py), by chunks of at most 30 s spread over `transcribe_workers`
+processes (none inside a worker of `run_files`, see scripts/parallel.py), and
+the segments are put back at their time in the file.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import WHISPER_MODEL, WHISPER_LANGUAGE, transcribe_workers, vad_enabled
+from scripts import metrics
+from scripts.cancel import as_completed, check
+from scripts.models import whisper_model
+from scripts.parallel import limit_threads, nested_workers, thread_limit
+
+# Whisper adds hooks to the shared model during a call, so calls from several threads must not overlap
+_transcribe_lock = threading.Lock()
+# Whisper worker processes, kept for the next transcriptions of this process (models stay loaded)
+_pool = None
+_pool_settings = None
+_pool_lock = threading.Lock()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file, read by chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_transcript(transcript_path, key):
+    """Return the cached segments if `transcript_path` was made for `key`, else None."""
+    try:
+        with open(transcript_path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data["segments"] if data.get("key") == key else None
+
+
+def save_transcript(transcript_path, key, segments):
+    """Write the transcript atomically (a crash never leaves a half-written file)."""
+    tmp_path = f"{transcript_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "segments": segments}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, transcript_path)
+
+
+def init_transcribe_worker(threads, model_name):
+    """Worker initializer: cap threads then load Whisper once for the worker's lifetime."""
+    limit_threads(threads)
+    whisper_model(model_name)
+
+
+def transcribe_chunk(samples, model_name=WHISPER_MODEL, language=WHISPER_LANGUAGE):
+    """
+    Transcribe one chunk of 16 kHz audio.
+
+    Returns:
+        list[tuple]: (start, end, text) per segment, relative to the chunk
+    """
+    with _transcribe_lock:
+        result = whisper_model(model_name).transcribe(samples, language=language)
+    return [(float(s["start"]), float(s["end"]), s["text"]) for s in result["segments"]]
+
+
+def detect_language(samples, model_name=WHISPER_MODEL):
+    """Language spoken in the first 30 s of `samples` (16 kHz), from a single pass of the Whisper encoder."""
+    import whisper
+    model = whisper_model(model_name)
+    with _transcribe_lock:
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(samples), n_mels=model.dims.n_mels).to(model.device)
+        _, probs = model.detect_language(mel)
+    return max(probs, key=probs.get)
+
+
+def _chunk_pool(workers, model_name):
+    """Worker pool transcribing chunks, created on first use and reused."""
+    global _pool, _pool_settings
+    with _pool_lock:
+        if _pool is None or _pool_settings != (workers, model_name):
+            if _pool is not None:
+                _pool.shutdown()
+            threads = max(1, thread_limit() // workers)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=init_transcribe_worker, initargs=(threads, model_name))
+            _pool_settings = (workers, model_name)
+        return _pool
+
+
+def transcribe_speech(audio_path, model_name=WHISPER_MODEL, language=WHISPER_LANGUAGE, workers=transcribe_workers,
+                      cancel=None):
+    """
+    Transcribe only the passages with speech (see scripts/vad.py), by chunks in parallel.
+
+    The chunk timestamps are shifted back to the time of the chunk in the file.
+    When `language` is None, it is detected once on the longest chunk and used
+    for all of them, so that every chunk is transcribed in the same language.
+    `cancel` (threading.Event) is checked between chunks (see scripts/cancel.py).
+
+    Returns:
+        list[dict]: Segments with "start", "end" (seconds) and "text"
+    """
+    global _pool
+    from scripts.vad import SAMPLE_RATE, load_audio, speech_chunks, speech_regions
+    samples = load_audio(audio_path)
+    with metrics.span("audio.vad"):
+        chunks = speech_chunks(speech_regions(samples))
+    speech_seconds = sum(end - start for start, end in chunks)
+    metrics.count("audio.speech_seconds", speech_seconds)
+    print(f"🎙️ Parole : {speech_seconds:.0f}s sur {len(samples) / SAMPLE_RATE:.0f}s, {len(chunks)} morceau(x)")
+    if not chunks:
+        return []
+
+    pieces = [samples[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)] for start, end in chunks]
+    longest = max(range(len(pieces)), key=lambda i: len(pieces[i]))
+    workers = min(nested_workers(workers), len(pieces))
+    try:
+        if workers <= 1:
+            language = language or detect_language(pieces[longest], model_name)
+            results = []
+            for piece in pieces:
+                check(cancel)
+                results.append(transcribe_chunk(piece, model_name, language))
+        else:
+            pool = _chunk_pool(workers, model_name)
+            language = language or pool.submit(detect_language, pieces[longest], model_name).result()
+            check(cancel)
+            futures = [pool.submit(transcribe_chunk, piece, model_name, language) for piece in pieces]
+            for _ in as_completed(futures, cancel):
+                pass  # Only waits for the chunks, unless cancelled
+            results = [future.result() for future in futures]
+    except BrokenProcessPool:
+        with _pool_lock:
+            _pool = None  # A worker died (e.g. out of memory), start a new pool next time
+        raise
+
+    segments = []
+    for (chunk_start, chunk_end), chunk_segments in zip(chunks, results):
+        for start, end, text in chunk_segments:
+            segments.append({"start": float(chunk_start + start), "end": float(min(chunk_end, chunk_start + end)),
+                             "text": text})
+    return segments
+
+
+def transcribe(audio_path, transcript_path=None, model_name=WHISPER_MODEL, language=WHISPER_LANGUAGE, cancel=None):
+    """
+    Transcribe an audio file, reusing the saved transcript when possible.
+
+    Args:
+        audio_path (str): Path to the audio file
+        transcript_path (str): Optional JSON file where the transcript is cached
+        model_name (str): Whisper model name
+        language (str): Spoken language (e.g. "fr"), None for automatic detection
+        cancel (threading.Event): Stops between chunks when set, the transcript is then not saved
+
+    Returns:
+        list[dict]: Segments with "start", "end" (seconds) and "text"
+    """
+    key = {"audio_sha256": file_hash(audio_path), "model": model_name, "language": language, "vad": vad_enabled}
+    if transcript_path is not None:
+        segments = load_transcript(transcript_path, key)
+        if segments is not None:
+            print(f"📝 Transcription réutilisée : {transcript_path}")
+            return segments
+
+    with metrics.span("whisper.transcribe"):
+        if vad_enabled:
+            segments = transcribe_speech(audio_path, model_name, language, cancel=cancel)
+        else:
+            with _transcribe_lock:
+                result = whisper_model(model_name).transcribe(audio_path, language=language)
+            segments = [{"start": float(segment["start"]), "end": float(segment["end"]), "text": segment["text"]}
+                        for segment in result["segments"]]
+
+    check(cancel)  # A cancelled job leaves no transcript
+    if transcript_path is not None:
+        save_transcript(transcript_path, key, segments)
+    return segments
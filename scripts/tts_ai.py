@@ -3,103 +3,187 @@ Script to anonymize a video by extracting its audio, transcribing it with Whispe
 synthesizing it with TTS, and replacing the original audio in the video.
 """
 
+import multiprocessing
 import os
-import subprocess
 import tempfile
 import argparse
-from moviepy import VideoFileClip
-from pydub import AudioSegment
-import whisper
-from TTS.api import TTS
-from TTS.utils.manage import ModelManager
-
-from TTS.tts.configs.xtts_config import XttsConfig
-from TTS.tts.models.xtts import XttsAudioConfig, XttsArgs
-from TTS.config.shared_configs import BaseDatasetConfig
-from TTS.utils.radam import RAdam
-import collections
-import torch
-
-from config import TTS_MODEL_NAME, WHISPER_MODEL
-from scripts.subtitles import generate_subtitles
-
-
-torch.serialization.add_safe_globals([XttsConfig, XttsAudioConfig, BaseDatasetConfig, XttsArgs, 
-                                      RAdam, collections.defaultdict, dict])
-manager = ModelManager()
-# print(manager.list_models())
-
-# === Étape 1 : Extraction de l'audio ===
-def extract_audio(video_path, output_audio_path):
-    video = VideoFileClip(video_path)
-    video.audio.write_audiofile(output_audio_path)
-
-# === Étape 2 : Transcription avec Whisper ===
-def transcribe_audio(audio_path, model_name="small"):
-    model = whisper.load_model(model_name)
-    result = model.transcribe(audio_path, language="fr")
-    return result["segments"]
+import threading
+import wave
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from scipy.io import wavfile
+
+from config import TTS_LANGUAGE, TTS_MODEL_NAME, tts_workers, tts_cache_size
+from scripts import metrics
+from scripts.audio import extract_audio
+from scripts.cancel import as_completed, check
+from scripts.outputs import replace_audio
+from scripts.models import tts_model
+from scripts.parallel import limit_threads, nested_workers, thread_limit
+from scripts.subtitles import write_srt
+from scripts.transcription import transcribe
+
+# Phrases already synthesized in this process: (model, text) -> (sample rate, float32 samples)
+_phrase_cache = OrderedDict()
+_synthesis_lock = threading.Lock()  # The TTS model is not thread-safe (daemon.py runs jobs in threads)
+_cache_lock = threading.Lock()  # Guards _phrase_cache, shared by the jobs of daemon.py
+# Processus de synthèse, gardés pour les vidéos suivantes de ce processus (modèles déjà chargés)
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+def audio_duration(audio_path):
+    """Durée en secondes d'un fichier WAV (lue dans l'en-tête)."""
+    with wave.open(audio_path) as f:
+        return f.getnframes() / f.getframerate()
+
+def init_tts_worker(threads):
+    """Initialisation d'un worker de synthèse : chacun charge son propre modèle TTS."""
+    limit_threads(threads)
+    tts_model()
+
+def synthesize_phrase(text):
+    """Synthétise `text` en mémoire. Retourne (fréquence d'échantillonnage, échantillons float32)."""
+    tts = tts_model()
+    with _synthesis_lock:
+        samples = np.asarray(tts.tts(text=text), dtype=np.float32)
+    return tts.synthesizer.output_sample_rate, samples
+
+def _phrase_key(text):
+    """Clé du cache : deux phrases qui ne diffèrent que par les espaces ou la casse partagent leur audio."""
+    return TTS_MODEL_NAME, " ".join(text.split()).casefold()
+
+def _synthesis_pool(workers):
+    """Processus de synthèse, créés à la première utilisation puis réutilisés."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            threads = max(1, thread_limit() // workers)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=init_tts_worker, initargs=(threads,))
+            _pool_workers = workers
+        return _pool
+
+def synthesize_phrases(texts, workers=tts_workers, cancel=None):
+    """
+    Synthétise chaque phrase distincte de `texts` une seule fois.
+
+    Les phrases déjà synthétisées (dans cette vidéo ou une précédente traitée par
+    le même processus) viennent du cache. Les autres sont réparties entre
+    `workers` processus, chacun avec son propre modèle TTS, gardés d'une vidéo à l'autre.
+    `cancel` (threading.Event) arrête la synthèse entre deux phrases (voir scripts/cancel.py).
+
+    Returns:
+        dict: texte -> (fréquence d'échantillonnage, échantillons float32)
+    """
+    global _pool
+    workers = nested_workers(workers)
+    keys = {text: _phrase_key(text) for text in texts}
+    audio = {}
+    # Une phrase à synthétiser par clé absente du cache (sa première forme rencontrée) ; les
+    # autres sont copiées tout de suite, un autre job peut les retirer du cache ensuite
+    missing = {}
+    with _cache_lock:
+        for text, key in keys.items():
+            if key in _phrase_cache:
+                _phrase_cache.move_to_end(key)
+                audio[text] = _phrase_cache[key]
+            else:
+                missing.setdefault(key, " ".join(text.split()))
+    metrics.count("tts.phrases", len(texts))
+    metrics.count("tts.cache_hits", len(texts) - len(missing))
+
+    synthesized = {}
+    if workers <= 1 or len(missing) <= 1:
+        for key, text in missing.items():
+            check(cancel)
+            synthesized[key] = synthesize_phrase(text)
+    else:
+        pool = _synthesis_pool(workers)
+        try:
+            # Les phrases les plus longues d'abord, pour ne pas en finir une seule à la fin
+            futures = {pool.submit(synthesize_phrase, text): key
+                       for key, text in sorted(missing.items(), key=lambda item: -len(item[1]))}
+            for future in as_completed(futures, cancel):
+                synthesized[futures[future]] = future.result()
+        except BrokenProcessPool:
+            with _pool_lock:
+                _pool = None  # Un processus est mort (ex. mémoire), un nouveau pool sera créé
+            raise
+
+    for text, key in keys.items():
+        if text not in audio:
+            audio[text] = synthesized[key]
+    with _cache_lock:
+        _phrase_cache.update(synthesized)
+        while len(_phrase_cache) > tts_cache_size:
+            _phrase_cache.popitem(last=False)
+    return audio
 
 # === Étape 3 : Synthèse vocale avec ajustement temporel ===
-def synthesize_segments_with_timing(segments, output_audio_path):
-    tts = TTS(model_name=TTS_MODEL_NAME,progress_bar=False, gpu=False)
-    combined = AudioSegment.silent(duration=0)
-
-    for segment in segments:
-        text = segment["text"].strip()
-        start = segment["start"]
-        end = segment["end"]
-        target_duration_ms = int((end - start) * 1000)
-
+def synthesize_segments_with_timing(segments, output_audio_path, duration=None, workers=tts_workers, cancel=None):
+    """
+    Synthétise les segments de Whisper et les place à leur instant de début.
+
+    La piste est allouée une seule fois à sa longueur finale (`duration`, ou la fin
+    du dernier segment) et chaque voix y est copiée à sa position : les silences
+    entre les segments sont conservés, le décalage ne s'accumule pas. Une voix
+    plus longue que son segment peut déborder sur le silence qui suit, mais est
+    coupée au début du segment suivant.
+    """
+    texts = [segment["text"].strip() for segment in segments]
+    audio = synthesize_phrases([text for text in texts if text], workers=workers, cancel=cancel)
+    rate = next(iter(audio.values()))[0] if audio else 22050
+    if duration is None:
+        duration = max((segment["end"] for segment in segments), default=0)
+    output = np.zeros(int(round(duration * rate)), dtype=np.float32)
+
+    for i, (segment, text) in enumerate(zip(segments, texts)):
         if not text:
-            combined += AudioSegment.silent(duration=target_duration_ms)
             continue
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_wav:
-            tts.tts_to_file(text=text, file_path=tmp_wav.name)
-            synthetic = AudioSegment.from_wav(tmp_wav.name)
-            os.remove(tmp_wav.name)
-
-        actual_duration_ms = len(synthetic)
-
-        if actual_duration_ms < target_duration_ms:
-            padding = AudioSegment.silent(duration=target_duration_ms - actual_duration_ms)
-            synthetic = synthetic + padding
-        else:
-            synthetic = synthetic[:target_duration_ms]
-
-        combined += synthetic
-
-    combined.export(output_audio_path, format="wav")
-
-def replace_audio_in_video(original_video_path, new_audio_path, output_video_path):
-    command = [
-        "ffmpeg",
-        "-y",
-        "-i", original_video_path,
-        "-i", new_audio_path,
-        "-c:v", "copy",
-        "-map", "0:v:0",
-        "-map", "1:a:0",
-        "-shortest",
-        output_video_path
-    ]
-    subprocess.run(command, check=True)
-
-def process_tts(path, anonymized_output_path, output_srt, use_blur='pixelate'):
+        start = int(round(segment["start"] * rate))
+        stop = int(round(segments[i + 1]["start"] * rate)) if i + 1 < len(segments) else len(output)
+        stop = min(stop, len(output))
+        samples = audio[text][1][:max(0, stop - start)]
+        output[start:start + len(samples)] = samples
+
+    wavfile.write(output_audio_path, rate, (np.clip(output, -1, 1) * 32767).astype(np.int16))
+
+def prepare_tts(source_path, audio_dir, output_srt, transcript_path=None, cancel=None):
+    """
+    Branche audio du mode TTS : transcription puis voix synthétique, depuis la vidéo d'origine.
+
+    `cancel` (threading.Event) arrête la branche entre ses étapes (voir scripts/cancel.py).
+
+    Returns:
+        str: Chemin du WAV synthétique
+    """
+    audio_path = os.path.join(audio_dir, "original_audio.wav")
+    synthetic_audio_path = os.path.join(audio_dir, "synthetic_audio.wav")
+
+    # === Étape 1 : Extraction de l'audio ===
+    print("🔊 Extraction de l'audio...")
+    extract_audio(source_path, audio_path, cancel)
+
+    # === Étape 2 : Transcription avec Whisper (une seule fois pour les sous-titres et la synthèse) ===
+    print("📝 Transcription avec Whisper...")
+    segments = transcribe(audio_path, transcript_path, language=TTS_LANGUAGE, cancel=cancel)
+    write_srt(segments, output_srt)
+
+    print("🗣️ Synthèse vocale avec ajustement temporel...")
+    with metrics.span("tts.synthesize"):
+        synthesize_segments_with_timing(segments, synthetic_audio_path, duration=audio_duration(audio_path),
+                                        cancel=cancel)
+    return synthetic_audio_path
+
+def process_tts(path, anonymized_output_path, output_srt, use_blur='pixelate', transcript_path=None):
     with tempfile.TemporaryDirectory() as tmpdir:
-        audio_path = os.path.join(tmpdir, "original_audio.wav")
-        synthetic_audio_path = os.path.join(tmpdir, "synthetic_audio.wav")
-
-        print("🔊 Extraction de l'audio...")
-        extract_audio(path, audio_path)
-
-        generate_subtitles(audio_path, output_srt)
-
-        print("📝 Transcription avec Whisper...")
-        segments = transcribe_audio(audio_path, WHISPER_MODEL)
-
-        print("🗣️ Synthèse vocale avec ajustement temporel...")
-        synthesize_segments_with_timing(segments, synthetic_audio_path)
+        synthetic_audio_path = prepare_tts(path, tmpdir, output_srt, transcript_path)
 
         print("🎬 Remplacement de l'audio dans la vidéo...")
-        replace_audio_in_video(path, synthetic_audio_path, anonymized_output_path)
\ No newline at end of file
+        replace_audio(path, synthetic_audio_path, anonymized_output_path)
@@ -0,0 +1,155 @@
+"""
+Voice activity detection in front of Whisper.
+
+Whisper spends as much time on silence, music and background noise as on
+speech, and one call over a long recording keeps a single process busy. The
+audio is cut instead into the chunks that contain speech:
+
+- the signal is resampled to 16 kHz (what Whisper expects) and cut into
+  30 ms frames;
+- a frame is speech when its energy is well above the noise floor of the file
+  and its spectrum (100 Hz - 4 kHz) is not flat like noise (spectral flatness);
+- speech frames are grouped into regions (padded, short gaps filled, short
+  blips dropped), then regions into chunks of at most `vad_max_chunk_seconds`
+  (Whisper works on 30 s windows), which can be transcribed in parallel.
+
+Only NumPy/SciPy are used, the same stack as scripts/fourier.py.
+"""
+
+from math import gcd
+
+import numpy as np
+from scipy import fft as sp_fft
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+from config import (vad_energy_db, vad_flatness, vad_max_chunk_seconds, vad_min_silence, vad_min_speech,
+                    vad_padding)
+
+SAMPLE_RATE = 16000  # Whisper input rate
+FRAME = 480  # 30 ms at 16 kHz
+_BLOCK_FRAMES = 2000  # Frames analyzed at once (one minute), bounds the memory of the analysis
+MAX_GAP = 2.0  # Longer silences between two regions start a new chunk
+
+
+def load_audio(path, rate=SAMPLE_RATE, block_seconds=60):
+    """
+    Read a WAV file as mono float32 in [-1, 1] at `rate` Hz.
+
+    The file is memory-mapped and converted by blocks of `block_seconds`, so
+    only the 16 kHz result is held in memory, not a float copy of the source.
+    """
+    try:
+        source_rate, data = wavfile.read(path, mmap=True)
+    except ValueError:
+        source_rate, data = wavfile.read(path)
+    # Stereo: keep the first channel, as scripts/fourier.py
+    if data.ndim > 1:
+        data = data[:, 0]
+    if data.dtype.kind in "iu":
+        info = np.iinfo(data.dtype)
+        offset, scale = (info.min + info.max + 1) / 2, (info.max - info.min + 1) / 2  # uint8: 128, int16: 32768
+    else:
+        offset, scale = 0.0, 1.0
+    divisor = gcd(source_rate, rate)
+    up, down = rate // divisor, source_rate // divisor
+    # Blocks start on multiples of `down`, so that each one maps to whole output samples, and
+    # overlap by `pad` samples on each side, longer than the resampling filter
+    pad = down * -(-4096 // down)
+    block = down * max(1, int(block_seconds * source_rate) // down)
+    total = len(data)
+    samples = np.empty(-(-total * up // down), dtype=np.float32)
+    for start in range(0, total, block):
+        end = min(total, start + block)
+        first, last = max(0, start - pad), min(total, end + pad)
+        chunk = (np.asarray(data[first:last], dtype=np.float32) - offset) / scale
+        if up != down:
+            chunk = resample_poly(chunk, up, down)
+        out_start = start * up // down
+        out_end = -(-end * up // down)
+        skip = (start - first) * up // down
+        samples[out_start:out_end] = chunk[skip:skip + out_end - out_start]
+    return samples
+
+
+def frame_features(samples):
+    """
+    Energy (dBFS) and spectral flatness (0 = tonal, 1 = white noise) of each 30 ms frame.
+
+    Returns:
+        tuple[ndarray, ndarray]: Both of length len(samples) // FRAME
+    """
+    count = len(samples) // FRAME
+    window = np.hanning(FRAME).astype(np.float32)
+    freqs = np.fft.rfftfreq(FRAME, 1 / SAMPLE_RATE)
+    band = (freqs >= 100) & (freqs <= 4000)  # Voice band
+    energy = np.empty(count, dtype=np.float32)
+    flatness = np.empty(count, dtype=np.float32)
+    for start in range(0, count, _BLOCK_FRAMES):
+        frames = samples[start * FRAME:min(count, start + _BLOCK_FRAMES) * FRAME].reshape(-1, FRAME)
+        end = start + len(frames)
+        energy[start:end] = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        power = np.abs(sp_fft.rfft(frames * window, axis=1, workers=-1))[:, band] ** 2 + 1e-12
+        flatness[start:end] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    return energy, flatness
+
+
+def speech_regions(samples, energy_db=vad_energy_db, flatness=vad_flatness, padding=vad_padding,
+                   min_silence=vad_min_silence, min_speech=vad_min_speech):
+    """
+    Time ranges of `samples` (16 kHz) that contain speech.
+
+    Args:
+        samples (ndarray): Mono float32 signal at 16 kHz
+        energy_db (float): Margin in dB above the noise floor (10th percentile of the frame energies)
+        flatness (float): Frames flatter than this are noise, whatever their energy
+        padding (float): Seconds added before and after each region
+        min_silence (float): Gaps shorter than this (seconds) are filled
+        min_speech (float): Regions shorter than this (seconds) are dropped
+
+    Returns:
+        list[tuple[float, float]]: (start, end) in seconds, sorted and disjoint
+    """
+    energy, frame_flatness = frame_features(samples)
+    if not len(energy):
+        return []
+    floor = np.percentile(energy, 10)
+    # Never speech below -50 dBFS, even in a file that is silent most of the time
+    speech = (energy > max(floor + energy_db, -50)) & (frame_flatness < flatness)
+
+    # Start and end frame of each run of speech frames
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], speech.astype(np.int8), [0]])))
+    frame_seconds = FRAME / SAMPLE_RATE
+    duration = len(samples) / SAMPLE_RATE
+    regions = []  # [start, end, seconds of speech frames]
+    for start, end in zip(edges[::2] * frame_seconds, edges[1::2] * frame_seconds):
+        speech_seconds = end - start
+        start, end = max(0.0, start - padding), min(duration, end + padding)
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1][1] = end
+            regions[-1][2] += speech_seconds
+        else:
+            regions.append([start, end, speech_seconds])
+    return [(start, end) for start, end, speech_seconds in regions if speech_seconds >= min_speech]
+
+
+def speech_chunks(regions, max_seconds=vad_max_chunk_seconds, max_gap=MAX_GAP):
+    """
+    Group speech regions into chunks of at most `max_seconds`, longer regions being split.
+
+    Regions separated by less than `max_gap` seconds share a chunk, so that
+    Whisper keeps the context of the sentence.
+
+    Returns:
+        list[tuple[float, float]]: (start, end) of each chunk in seconds
+    """
+    chunks = []
+    for start, end in regions:
+        if chunks and start - chunks[-1][1] <= max_gap and end - chunks[-1][0] <= max_seconds:
+            chunks[-1] = (chunks[-1][0], end)
+            continue
+        while end - start > max_seconds:
+            chunks.append((start, start + max_seconds))
+            start += max_seconds
+        chunks.append((start, end))
+    return chunks
@@ -1,13 +1,151 @@
 import cv2
+import json
 import os
 import subprocess
+import time
+from fractions import Fraction
+
+import numpy as np
 from tqdm import tqdm
 
-from scripts.detect import detect_and_anonymize_faces
+from config import batch_size as default_batch_size, detect_stride as default_detect_stride
+from config import detection_index, queue_size, x264_preset, x264_crf
+from scripts import metrics
+from scripts.detect import FaceAnonymizer
+from scripts.detection_index import DetectionIndex
+from scripts.pipeline import run_pipeline
+from scripts.tracking import KeyframeTracker
+
+def probe_frame_rate(path):
+    """
+    Read the exact frame rate of the first video stream with ffprobe.
+
+    Args:
+        path (str): Path to the video file
+
+    Returns:
+        Fraction: Frame rate (e.g. 30000/1001), or None if ffprobe could not read it
+    """
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=avg_frame_rate,r_frame_rate",
+        "-of", "json",
+        path
+    ]
+    try:
+        output = metrics.run(command, capture_output=True, text=True, check=True).stdout
+        streams = json.loads(output).get("streams", [])
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+    for stream in streams:
+        # avg_frame_rate is "0/0" when unknown, fall back to r_frame_rate
+        for key in ("avg_frame_rate", "r_frame_rate"):
+            num, _, den = stream.get(key, "0/0").partition("/")
+            if num.isdigit() and den.isdigit() and int(num) and int(den):
+                return Fraction(int(num), int(den))
+    return None
+
+class FFmpegWriter:
+    """
+    Stream BGR frames over stdin into a single ffmpeg process encoding H.264.
+
+    When `audio_source` is given, its first audio track is muxed in the same
+    command, so no intermediate video file is needed.
+    """
+
+    def __init__(self, output_path, width, height, fps, audio_source=None, preset=x264_preset, crf=x264_crf):
+        """
+        Args:
+            output_path (str): Path of the encoded video
+            width, height (int): Frame size in pixels
+            fps (Fraction): Exact frame rate of the written frames
+            audio_source (str): Optional file whose first audio track is copied to the output
+            preset (str): x264 preset (e.g. "veryfast", "medium")
+            crf (int): x264 constant rate factor, lower is better quality
+        """
+        fps = Fraction(fps)
+        self.frame_size = (height, width, 3)
+        self.command = [
+            "ffmpeg",
+            "-y",  # Overwrite output file if it exists
+            "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}",
+            "-r", f"{fps.numerator}/{fps.denominator}",
+            "-i", "-",  # Frames come from stdin
+        ]
+        if audio_source is not None:
+            self.command += [
+                "-i", audio_source,
+                "-map", "0:v:0",
+                "-map", "1:a:0?",  # Audio is optional, silent videos have none
+                "-c:a", "aac",
+            ]
+        if width % 2 or height % 2:
+            # yuv420p needs even dimensions
+            self.command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        self.command += [
+            "-c:v", "libx264",
+            "-preset", preset,
+            "-crf", str(crf),
+            "-pix_fmt", "yuv420p",
+            output_path
+        ]
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE)
+        self.start = time.perf_counter()
+
+    def write(self, frame):
+        if frame.shape != self.frame_size:
+            raise ValueError(f"Frame of shape {frame.shape} does not match writer size {self.frame_size}")
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        """Flush the remaining frames and wait for ffmpeg to finish encoding."""
+        self.process.stdin.close()
+        code = self.process.wait()
+        metrics.record("subprocess.ffmpeg_encode", time.perf_counter() - self.start)
+        if code:
+            raise subprocess.CalledProcessError(code, self.command)
+
+    def abort(self):
+        """Stop ffmpeg without waiting for a clean output (used on errors)."""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.kill()
+        self.process.wait()
 
-def process_video(input_path, output_path, use_blur='pixelate'):
+def process_video(input_path, output_path, use_blur='pixelate', batch_size=default_batch_size,
+                  detect_stride=default_detect_stride, start_frame=0, end_frame=None, warmup_frames=0,
+                  with_audio=True, use_index=detection_index, index_key=None, save_index=True):
     """
     Treat a video to blur or pixelate faces.
+
+    The anonymized frames are encoded to H.264 by ffmpeg together with the
+    original audio track, directly into `output_path`.
+
+    Decoding, detection and encoding run on separate threads (see
+    scripts/pipeline.py). Frames are sent to YOLO in batches of `batch_size`,
+    then anonymized and written in their original order.
+
+    With `detect_stride` > 1, YOLO only runs on keyframes (every `detect_stride`
+    frames or on scene cuts) and faces are tracked in between (see
+    scripts/tracking.py) instead of using the recent faces memory.
+
+    Only frames [start_frame, end_frame) are written when a segment is given.
+    The `warmup_frames` frames before `start_frame` are still analyzed (but not
+    written), so that the face memory is filled when the segment starts.
+
+    With `use_index`, the raw detections are read from and saved to the
+    detection index of the input (see scripts/detection_index.py): a rerun only
+    runs YOLO on frames it has never seen. `index_key` avoids hashing the input
+    again. With `save_index` False the index is left untouched and the new
+    detections are returned instead ({frame index: raw detections}), for the
+    caller to save (used by the parallel segments of scripts/chunks.py).
     """
     cap = cv2.VideoCapture(input_path)
     if not cap.isOpened():
@@ -16,45 +154,86 @@ def process_video(input_path, output_path, use_blur='pixelate'):
 
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    # Keep the exact rational frame rate (29.97 is 30000/1001, not 29)
+    fps = probe_frame_rate(input_path) or Fraction(cap.get(cv2.CAP_PROP_FPS)).limit_denominator(1001)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if end_frame is None or end_frame > total_frames:
+        end_frame = None
+    first_frame = max(0, start_frame - warmup_frames)
+    if first_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    # Frames to read, and warm-up frames to drop before writing
+    remaining = None if end_frame is None else end_frame - first_frame
+    skip = start_frame - first_frame
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    out = FFmpegWriter(output_path, width, height, fps, audio_source=input_path if with_audio else None)
 
-    for _ in tqdm(range(total_frames), desc=f"Traitement de {os.path.basename(input_path)}"):
+    def read_frame():
+        nonlocal remaining
+        if remaining is not None:
+            if remaining <= 0:
+                return None
+            remaining -= 1
         ret, frame = cap.read()
-        if not ret:
-            break
-        frame = detect_and_anonymize_faces(frame, use_blur)
-        out.write(frame)
+        return frame if ret else None
 
-    cap.release()
-    out.release()
-    print(f"Vidéo sauvegardée : {output_path}")
+    def write_frame(frame):
+        nonlocal skip
+        if skip:
+            skip -= 1
+        else:
+            out.write(frame)
 
+    # Face memory and tracker belong to this video only
+    anonymizer = FaceAnonymizer(use_blur)
+    tracker = KeyframeTracker(stride=detect_stride) if detect_stride > 1 else None
+    index = DetectionIndex(input_path, key=index_key) if use_index else None
+    next_frame = first_frame  # Index in the video of the next frame to process
 
-def add_audio_to_video(original_video, video_no_audio, output_with_audio):
-    """
-    Add original audio track to a processed video file using FFmpeg.
-    
-    Args:
-        original_video (str): Path to original video with audio
-        video_no_audio (str): Path to processed video without audio
-        output_with_audio (str): Path for final video with audio
-    """
-    # Build FFmpeg command to combine video and audio streams
-    command = [
-        'ffmpeg',
-        '-y',  # Overwrite output file if it exists
-        '-i', video_no_audio,  # Input processed video
-        '-i', original_video,  # Input original video (for audio)
-        '-c:v', 'copy',  # Copy video stream without re-encoding
-        '-c:a', 'aac',   # Encode audio as AAC
-        '-map', '0:v:0',  # Map video from first input
-        '-map', '1:a:0',  # Map audio from second input
-        output_with_audio
-    ]
-    
-    # Execute FFmpeg command (suppress output for cleaner console)
-    subprocess.run(command)#, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    def detect(frames, indices):
+        return index.detect(frames, indices) if index is not None else anonymizer.detect(frames)
+
+    def process_batch(frames):
+        nonlocal next_frame
+        indices = list(range(next_frame, next_frame + len(frames)))
+        next_frame += len(frames)
+        if tracker is None:
+            # One inference call for the whole batch, then anonymize in order
+            return [anonymizer.anonymize(frame, faces)
+                    for frame, faces in zip(frames, detect(frames, indices))]
+
+        # Only keyframes go through YOLO, the other frames are tracked
+        keyframes = tracker.plan(frames)
+        detections = iter(detect([f for f, key in zip(frames, keyframes) if key],
+                                 [i for i, key in zip(indices, keyframes) if key]))
+        processed = []
+        for frame, key in zip(frames, keyframes):
+            with metrics.span("frame.track"):
+                faces = tracker.update(frame, next(detections) if key else None)
+            metrics.observe("faces_per_frame", len(faces))
+            processed.append(anonymizer.apply(frame, faces))
+        return processed
+
+    desc = f"Traitement de {os.path.basename(input_path)}"
+    if start_frame or end_frame is not None:
+        desc += f" [{start_frame}-{end_frame if end_frame is not None else total_frames}]"
+    try:
+        with tqdm(total=(end_frame or total_frames) - first_frame, desc=desc) as pbar:
+            stats = run_pipeline(read_frame, process_batch, write_frame,
+                                 batch_size=batch_size, queue_size=queue_size,
+                                 on_written=pbar.update)
+    except BaseException:
+        out.abort()
+        raise
+    finally:
+        cap.release()
+    out.release()
+    for stat in stats:
+        metrics.record(f"pipeline.{stat.name}", stat.busy)
+    metrics.count("frames.processed", stats[-1].frames)
+    print(" | ".join(str(stat) for stat in stats))
+    print(f"Vidéo sauvegardée : {output_path}")
+    if index is not None:
+        if not save_index:
+            return index.new
+        index.save()